@@ -0,0 +1,123 @@
+import csv
+import gc
+import json
+import random
+import resource
+import time
+import tracemalloc
+import numpy as np
+
+CONFIDENCE = 0.95
+BOOTSTRAP_SAMPLES = 1000
+
+def seed_everything(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+
+def current_rss():
+    # Resident set size in bytes (Linux), or None where /proc is missing
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return None
+
+def peak_rss():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def summarize(samples, seed=0):
+    # Median and IQR, plus a bootstrap confidence interval for the median
+    samples = np.asarray(samples, dtype=np.float64)
+    q1, median, q3 = np.percentile(samples, [25, 50, 75])
+    resamples = np.random.default_rng(seed).choice(samples, (BOOTSTRAP_SAMPLES, len(samples)))
+    ci_low, ci_high = np.percentile(np.median(resamples, axis=1),
+                                    [50 * (1 - CONFIDENCE), 50 * (1 + CONFIDENCE)])
+    return {'median_ns': median,
+            'iqr_ns': q3 - q1,
+            'ci_low_ns': ci_low,
+            'ci_high_ns': ci_high,
+            'mean_ns': samples.mean(),
+            'rounds': len(samples)}
+
+def time_function(function, rounds=5, warmup=1):
+    # Timing pass: warmup calls are discarded, GC is collected before and
+    # disabled during each timed call
+    for _ in range(warmup):
+        function()
+    samples = []
+    for _ in range(rounds):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter_ns()
+            function()
+            samples.append(time.perf_counter_ns() - start)
+        finally:
+            gc.enable()
+    return summarize(samples)
+
+def memory_function(function):
+    # Memory pass, separate from timing since tracemalloc slows every
+    # allocation. Peak is the most allocated at once during the call and
+    # retained is what the returned result still holds afterwards.
+    gc.collect()
+    rss_before = current_rss()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    result = function()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = current_rss()
+    return {'peak_bytes': peak - baseline,
+            'retained_bytes': current - baseline,
+            'rss_delta_bytes': None if rss_before is None else rss_after - rss_before,
+            'peak_rss_bytes': peak_rss()}, result
+
+def write_results(path, records):
+    if path.endswith('.csv'):
+        fields = sorted({field for record in records for field in record})
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(records)
+    else:
+        with open(path, 'w') as f:
+            json.dump(records, f, indent=2, default=float)
+
+def read_results(path):
+    if path.endswith('.csv'):
+        with open(path, newline='') as f:
+            return list(csv.DictReader(f))
+    with open(path) as f:
+        return json.load(f)
+
+KEY_FIELDS = ('phase', 'algorithm', 'dataset', 'size', 'sparse_step', 'query_size', 'query')
+COMPARED_FIELDS = ('median_ns', 'peak_bytes', 'retained_bytes', 'query_latency_ns') # The last from sweeps
+
+def record_key(record):
+    # CSV files hold missing fields as '' and every value as a string
+    return tuple('' if record.get(field) in (None, '') else str(record[field]) for field in KEY_FIELDS)
+
+def compare_results(records, baseline, threshold=0.1):
+    # Fields whose time or memory grew by more than threshold (a fraction)
+    # over the matching baseline record
+    baseline = {record_key(record): record for record in baseline}
+    regressions = []
+    for record in records:
+        previous = baseline.get(record_key(record))
+        if previous is None:
+            continue
+        for field in COMPARED_FIELDS:
+            if record.get(field) in (None, '') or previous.get(field) in (None, ''):
+                continue
+            new, old = float(record[field]), float(previous[field])
+            if field == 'median_ns' and record.get('ci_low_ns') not in (None, ''):
+                # Timing must also clear the noise: the confidence intervals
+                # of the two medians may not overlap
+                if float(record['ci_low_ns']) <= float(previous['ci_high_ns']):
+                    continue
+            if old > 0 and new > old * (1 + threshold):
+                regressions.append({'key': record_key(record), 'field': field,
+                                    'baseline': old, 'current': new, 'ratio': new / old})
+    return regressions
@@ -0,0 +1,315 @@
+import argparse
+import numpy as np
+import index_io
+import profiling
+import record_table
+import utils
+from suffix_array import SuffixArray, index_dtype, kasai_lcp
+
+LCP_CAP = 255 # Stored LCP values (plus one) from here on are in the overflow table
+MIXED = -1 # Left character of an interval whose suffixes follow different ones
+MUM_SEPARATOR = '#'
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Enhanced suffix array')
+
+    parser.add_argument('--reference',
+                        help='Reference sequence file',
+                        type=str)
+
+    parser.add_argument('--string',
+                        help='Reference sequence',
+                        type=str)
+
+    parser.add_argument('--query',
+                        help='Query sequences',
+                        nargs='+',
+                        type=str)
+
+    parser.add_argument('--locate',
+                        help='Print up to this many hits of each query as record:offset',
+                        type=int)
+
+    parser.add_argument('--repeats',
+                        help='Print the maximal repeats of at least --min_length characters',
+                        action='store_true')
+
+    parser.add_argument('--mums',
+                        help='Print the maximal unique matches of at least --min_length '
+                             'characters with the first record of this FASTA file',
+                        type=str)
+
+    parser.add_argument('--min_length',
+                        help='Shortest repeat or MUM to print (default: 20)',
+                        type=int,
+                        default=20)
+
+    parser.add_argument('--index',
+                        help='Load a saved index instead of building one',
+                        type=str)
+
+    parser.add_argument('--build_index', '--build-index',
+                        help='Save the built index to this file',
+                        type=str)
+
+    return parser.parse_args()
+
+def child_table(lcp):
+    # Compact child table (Abouelhoda et al.) of an LCP list with -1 at both
+    # ends. cld[k] holds nextlIndex[k] where it exists, else down[k], and
+    # cld[k - 1] holds up[k]; the accessors tell them apart by LCP value.
+    n = len(lcp) - 1
+    cld = [0] * (n + 1)
+
+    stack, last = [0], -1
+    for k in range(1, n + 1):
+        while lcp[k] < lcp[stack[-1]]:
+            last = stack.pop()
+            top = stack[-1]
+            if lcp[k] <= lcp[top] and lcp[top] != lcp[last]:
+                cld[top] = last # down[top]
+        if last != -1:
+            cld[k - 1] = last # up[k]
+            last = -1
+        stack.append(k)
+
+    stack = [0]
+    for k in range(1, n):
+        while lcp[k] < lcp[stack[-1]]:
+            stack.pop()
+        if lcp[k] == lcp[stack[-1]]:
+            cld[stack.pop()] = k # nextlIndex
+        stack.append(k)
+    return cld
+
+class EnhancedSuffixArray(SuffixArray):
+    # Suffix array plus LCP and child tables, which together stand in for
+    # the suffix tree (Abouelhoda, Kurtz and Ohlebusch). Internal nodes are
+    # lcp-intervals of the array; the child table gives the children of an
+    # interval in constant time each, so searches walk the "tree" top-down
+    # and the LCP table alone gives a bottom-up traversal. LCP values are
+    # one byte, with the rare large ones kept in a sorted overflow table.
+    __algorithm_name__ = 'Enhanced suffix array'
+    ESA_SECTIONS = ('lcp_table', 'lcp_overflow_index', 'lcp_overflow', 'child_table')
+
+    def __init__(self, T: str = None, profile=False, records=None, processes=None):
+        self.lcp_table, self.lcp_overflow_index, self.lcp_overflow, self.child_table = None, None, None, None
+        super().__init__(T, profile=profile, records=records, processes=processes)
+
+    def setup(self, T, lcp=False, kmer_length=None, processes=None, sparse_step=1):
+        super().setup(T, lcp, kmer_length, processes, sparse_step)
+        self.require_full_array('EnhancedSuffixArray')
+        self.build_child_table()
+
+    def align(self, query):
+        return self.search_tree(query)
+
+    def build_child_table(self):
+        n = len(self.array)
+        values = np.full(n + 1, -1, dtype=np.int64)
+        with profiling.phase(self.profile, 'lcp'):
+            values[1:n] = kasai_lcp(self.T, self.array)[1:]
+        with profiling.phase(self.profile, 'child_table'):
+            self.child_table = np.array(child_table(values.tolist()), dtype=index_dtype(n + 1))
+
+        # LCP + 1, so that the -1 ends fit in a byte
+        stored = values + 1
+        overflow = stored >= LCP_CAP
+        self.lcp_table = np.minimum(stored, LCP_CAP).astype(np.uint8)
+        self.lcp_overflow_index = np.flatnonzero(overflow).astype(index_dtype(n + 1))
+        self.lcp_overflow = values[overflow].astype(index_dtype(n + 1))
+        self.attach_tables()
+
+    def attach_tables(self):
+        # Memoryviews, so that the searches index the tables as plain ints
+        self.suffixes, self.lcps, self.cld = (memoryview(table) for table in
+                                              (self.array, self.lcp_table, self.child_table))
+
+    def index_sections(self):
+        sections = super().index_sections()
+        sections.update((name, getattr(self, name)) for name in self.ESA_SECTIONS)
+        return sections
+
+    @classmethod
+    def load(cls, path):
+        index = super().load(path)
+        _, sections = index_io.read_index(path, cls.__name__)
+        for name in cls.ESA_SECTIONS:
+            setattr(index, name, sections[name])
+        index.attach_tables()
+        return index
+
+    def lcp_value(self, k):
+        # LCP of the suffixes at rows k - 1 and k, -1 at both ends
+        stored = self.lcps[k]
+        if stored < LCP_CAP:
+            return stored - 1
+        return int(self.lcp_overflow[np.searchsorted(self.lcp_overflow_index, k)])
+
+    def lcp_array(self):
+        # Every LCP value as one int64 array, for the bottom-up traversals
+        values = self.lcp_table.astype(np.int64) - 1
+        values[self.lcp_overflow_index] = self.lcp_overflow
+        return values
+
+    def first_l_index(self, i, j):
+        # First child boundary of the lcp-interval [i..j]: up[j + 1] if it
+        # lies inside, else down[i]
+        cld = self.cld
+        if self.lcp_value(j) > self.lcp_value(j + 1) and i < cld[j] <= j:
+            return cld[j]
+        return cld[i]
+
+    def child_intervals(self, i, j):
+        # Child intervals [lo..hi] of the lcp-interval [i..j], in order,
+        # following the nextlIndex chain of its l-indexes
+        cld = self.cld
+        k = self.first_l_index(i, j)
+        depth = self.lcp_value(k)
+        lo = i
+        while True:
+            yield lo, k - 1
+            lo, following = k, cld[k]
+            if following <= k or self.lcp_value(following) != depth:
+                break
+            k = following
+        yield lo, j
+
+    def search_tree(self, P):
+        # Length of the longest prefix of P that occurs in the text, walking
+        # down the lcp-intervals as SuffixTree.search_tree walks its nodes
+        T, sa = self.T, self.suffixes
+        n, m = len(sa), len(P)
+
+        i, j = 0, n - 1
+        matched = 0
+
+        while True:
+            depth = n - sa[i] if i == j else self.lcp_value(self.first_l_index(i, j))
+            offset, end = sa[i], min(depth, m)
+            while matched < end:
+                if T[offset + matched] != P[matched]:
+                    return matched
+                matched += 1
+            if matched == m or i == j:
+                return matched
+
+            c = P[matched]
+            for lo, hi in self.child_intervals(i, j):
+                if T[sa[lo] + matched] == c:
+                    break
+            else:
+                return matched
+            i, j = lo, hi
+
+    def lcp_intervals(self):
+        # (lcp value, lo, hi, left character) of every lcp-interval, with hi
+        # exclusive, bottom-up: each is reported after all those inside it.
+        # The left character is the one before every suffix of the interval,
+        # or MIXED where they differ (so the interval is left-maximal); the
+        # start of the text counts as a character of its own.
+        n = len(self.array)
+        lcp = self.lcp_array().tolist()
+        codes = self.text_array().astype(np.int64)
+        left = np.where(self.array > 0, codes[self.array - 1], MIXED).tolist()
+
+        stack = [[0, 0, None]] # lcp value, lo, left character of the root
+        for k in range(1, n + 1):
+            value = max(lcp[k], 0) # The end closes everything but the root
+            lo, child_left = k - 1, left[k - 1]
+            while value < stack[-1][0]:
+                top_value, top_lo, top_left = stack.pop()
+                top_left = top_left if top_left == child_left else MIXED
+                yield top_value, top_lo, k, top_left
+                lo, child_left = top_lo, top_left
+            top = stack[-1]
+            if value > top[0]:
+                stack.append([value, lo, child_left])
+            elif top[2] is None:
+                top[2] = child_left
+            elif top[2] != child_left:
+                top[2] = MIXED
+        yield 0, 0, n, stack[0][2]
+
+    def repeats(self, min_length=1):
+        # (length, positions) of every maximal repeat of at least min_length
+        # characters: a string that occurs twice or more and cannot be
+        # extended to the left or right in all of its occurrences. Repeats
+        # that span two records are skipped.
+        T = self.T
+        for length, lo, hi, left in self.lcp_intervals():
+            if length < min_length or left != MIXED:
+                continue
+            start = int(self.array[lo])
+            if record_table.SEPARATOR in T[start:start + length]:
+                continue
+            yield length, self.array[lo:hi]
+
+def mums(a, b, min_length=20):
+    # Maximal unique matches of a and b, as (offset in a, offset in b,
+    # length) sorted by offset in a: strings that occur exactly once in each
+    # and cannot be extended either way. In the enhanced suffix array of
+    # a#b they are the lcp-intervals of two adjacent suffixes, one from each
+    # side, whose preceding characters differ.
+    esa = EnhancedSuffixArray(a + MUM_SEPARATOR + b)
+    sa = esa.array.astype(np.int64)
+    n, split = len(sa), len(a)
+    lcp = esa.lcp_array()
+    codes = esa.text_array()
+
+    k = np.arange(1, n)
+    inner = lcp[1:n]
+    peaks = (inner >= min_length) & (inner > lcp[:n - 1]) & (inner > lcp[2:])
+    k, lengths = k[peaks], inner[peaks]
+    first, second = sa[k - 1], sa[k]
+    # sa - 1 wraps to the '$' for offset 0, and b starts after the separator
+    keep = ((first < split) != (second < split)) & (codes[first - 1] != codes[second - 1])
+    first, second, lengths = first[keep], second[keep], lengths[keep]
+    in_a, in_b = np.minimum(first, second), np.maximum(first, second) - split - 1
+    order = np.argsort(in_a, kind='stable')
+    return list(zip(in_a[order].tolist(), in_b[order].tolist(), lengths[order].tolist()))
+
+def main():
+    args = get_args()
+
+    T, records = None, None
+
+    if args.string:
+        T = args.string
+    elif args.reference:
+        T, records = record_table.join_records(utils.iter_fasta(args.reference))
+
+    print('Extracted file')
+
+    if args.index:
+        esa = EnhancedSuffixArray.load(args.index)
+        if T is not None:
+            index_io.check_reference(args.index, T)
+    else:
+        esa = EnhancedSuffixArray(T, records=records)
+        if args.build_index:
+            esa.save(args.build_index)
+
+    print('Index built')
+
+    if args.query:
+        for query in args.query:
+            match_len = esa.align(query)
+            print(f'{query} : {match_len}')
+            if args.locate:
+                for record, offset in record_table.locate_records(esa, query, args.locate, sort=True):
+                    print(f'\t{record}:{offset}')
+
+    if args.repeats:
+        for length, positions in esa.repeats(args.min_length):
+            first = np.sort(positions)[:5].tolist()
+            hits = esa.records.resolve_all(first) if esa.records is not None else ((None, p) for p in first)
+            print(f'repeat {length} x{len(positions)}\t' + ' '.join(f'{record}:{offset}' for record, offset in hits))
+
+    if args.mums:
+        _, other = next(utils.iter_fasta(args.mums))
+        for offset, other_offset, length in mums(esa.T[:-1], other, args.min_length):
+            print(f'MUM {offset} {other_offset} {length}')
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,19 @@
-import time
-import tracemalloc
+import sys
 import utils
 import random
 import argparse
 import matplotlib.pyplot as plt
 import numpy as np
+import benchmark
+import profiling
+import record_table
 from suffix_trie import SuffixTrie
 from suffix_tree import SuffixTree
+from lazy_suffix_tree import LazySuffixTree
 from suffix_array import SuffixArray
+from enhanced_suffix_array import EnhancedSuffixArray
+from fm_index import FMIndex
+from suffix_automaton import SuffixAutomaton
 
 def get_args():
     parser = argparse.ArgumentParser()
@@ -18,9 +24,9 @@ def get_args():
                         required=True)
     parser.add_argument('--query_size',
                         type=int,
-                        required=True,
                         nargs=3,
-                        help='Query size range (start stop step)')
+                        help='Query size range (start stop step), required ' \
+                             + 'unless --scaling or --sparse_steps is given')
     parser.add_argument('--queries_per_size',
                         type=int,
                         default=5,
@@ -30,6 +36,63 @@ def get_args():
                         default=5,
                         help='Number of rounds to run each algorithm ' \
                              + '(default: 5)')
+    parser.add_argument('--warmup',
+                        type=int,
+                        default=1,
+                        help='Untimed warmup rounds before timing (default: 1)')
+    parser.add_argument('--seed',
+                        type=int,
+                        default=0,
+                        help='Random seed for query generation (default: 0)')
+    parser.add_argument('--results',
+                        type=str,
+                        help='Write results to this .json or .csv file')
+    parser.add_argument('--baseline',
+                        type=str,
+                        help='Compare results against this results file')
+    parser.add_argument('--threshold',
+                        type=float,
+                        default=0.1,
+                        help='Relative increase over the baseline reported ' \
+                             + 'as a regression (default: 0.1)')
+    parser.add_argument('--profile',
+                        action='store_true',
+                        help='Record search counters and build phase timings ' \
+                             + 'in a separate untimed pass')
+    parser.add_argument('--scaling',
+                        action='store_true',
+                        help='Sweep reference size instead of query size')
+    parser.add_argument('--scaling_start',
+                        type=int,
+                        default=1000,
+                        help='Smallest reference prefix in bases (default: 1000)')
+    parser.add_argument('--scaling_factor',
+                        type=float,
+                        default=2,
+                        help='Growth factor between prefixes (default: 2)')
+    parser.add_argument('--scaling_query_size',
+                        type=int,
+                        default=20,
+                        help='Query size for latency in the sweep (default: 20)')
+    parser.add_argument('--time_budget',
+                        type=float,
+                        default=60,
+                        help='Seconds one build may take before an algorithm ' \
+                             + 'is dropped from the sweep (default: 60)')
+    parser.add_argument('--memory_budget',
+                        type=float,
+                        default=1024,
+                        help='Megabytes one index may retain before an algorithm ' \
+                             + 'is dropped from the sweep (default: 1024)')
+    parser.add_argument('--sparse_steps',
+                        type=int,
+                        nargs='+',
+                        help='Benchmark sparse suffix arrays with these sampling ' \
+                             + 'steps (e.g. 1 2 4 8 16) instead of the query size sweep')
+    parser.add_argument('--sparse_query_size',
+                        type=int,
+                        default=32,
+                        help='Query size for the sparse suffix array curve (default: 32)')
     parser.add_argument('--out_file',
                         type=str,
                         required=True,
@@ -47,76 +110,85 @@ def get_args():
 def get_random_string(alphabet, length):
     return ''.join(random.choice(alphabet) for _ in range(length))
 
-def get_random_substring(string, length):
+def get_random_substring(string, length, attempts=100):
     if length > len(string):
         raise ValueError("Length of substring is longer than the string.")
 
-    start_index = random.randint(0, len(string) - length)
-    return string[start_index:start_index + length]
-
-def run_test(test_function):
-    start = time.monotonic_ns()
-    r = test_function()
-    stop = time.monotonic_ns()
-
-    tracemalloc.start()
-    r = test_function()
-    mem = tracemalloc.get_traced_memory()
-    tracemalloc.stop()
-
-    return stop - start, mem[1] - mem[0], r
-
-def test_queryset_for_model(model, queries, rounds=1):
-    run_times = []
-    mem_usages = []
+    # Draw again if the substring spans two records, unless they are all
+    # too short to avoid it
+    for _ in range(attempts):
+        start_index = random.randint(0, len(string) - length)
+        substring = string[start_index:start_index + length]
+        if record_table.SEPARATOR not in substring:
+            break
+    return substring
+
+def run_test(test_function, rounds=1, warmup=1):
+    timing = benchmark.time_function(test_function, rounds, warmup)
+    memory, r = benchmark.memory_function(test_function)
+    return timing, memory, r
+
+def profile_queries(model, queries, records):
+    # Counter pass after timing, so that the counting search methods never
+    # run inside a timed call
+    model.enable_profiling()
+    for query, record in zip(queries, records):
+        model.profile.reset()
+        model.align(query)
+        record.update(model.stats())
+        print(f'\t\tQUERY {record["query"]}' + profiling.format_stats(model.stats()))
+    model.disable_profiling()
+
+def test_queryset_for_model(model, queries, rounds=1, warmup=1, profile=False):
+    records = []
 
     print(f'\tQUERYSET FOR {model.__algorithm_name__}')
     for query_index, query in enumerate(queries):
         print(f'\t\tQUERY {query_index}')
-        _run_times = []
-        _mem_usages = []
-
-        for i in range(rounds):
-            run_time, mem_usage, _ = run_test(lambda: model.align(query))
-            _run_times.append(run_time)
-            _mem_usages.append(mem_usage)
-            
-        run_times.append(np.mean(_run_times))
-        mem_usages.append(np.mean(_mem_usages))
-        print(f'\t\t\tRUN TIME: {run_times[-1]}ns\tMEM USAGES: {mem_usages[-1]}b')
+        timing, memory, _ = run_test(lambda: model.align(query), rounds, warmup)
+        records.append({'phase': 'align',
+                        'algorithm': model.__algorithm_name__,
+                        'query_size': len(query),
+                        'query': query_index,
+                        **timing, **memory})
+        print(f'\t\t\tRUN TIME: {timing["median_ns"]:.0f}ns (IQR {timing["iqr_ns"]:.0f}ns)'
+              f'\tMEM PEAK: {memory["peak_bytes"]}b')
+
+    if profile and hasattr(model, 'enable_profiling'):
+        profile_queries(model, queries, records)
     
-    return run_times, mem_usages
+    return records
 
-def test_setup(algorithms, datasets, rounds=1):
-    run_times = [ [] for _ in range(len(algorithms)) ]
-    mem_usages = [ [] for _ in range(len(algorithms)) ]
+def test_setup(algorithms, datasets, rounds=1, warmup=1, profile=False):
+    records = []
     models = [ [] for _ in range(len(algorithms))]
 
     for algorithm_index, algorithm in enumerate(algorithms):
         for dataset_index, dataset in enumerate(datasets):
             print(f'\tSETUP FOR {algorithm.__algorithm_name__} ON DATASET {dataset_index}')
-            _run_times = []
-            _mem_usages = []
-            final_model = None
-
-            for i in range(rounds):
-                print(f'\t\tROUND {i}')
-                run_time, mem_usage, model = run_test(lambda: algorithm(dataset))
-                _run_times.append(run_time)
-                _mem_usages.append(mem_usage)
-                if i == 0:
-                    final_model = model
-                print(F'\t\t\tRUN TIME: {run_time}ns\tMEM USAGE: {mem_usage}b')
-                
-            run_times[algorithm_index].append(np.mean(_run_times))
-            mem_usages[algorithm_index].append(np.mean(_mem_usages))
-            models[algorithm_index].append(final_model)
-
-            print(f'\t\tRUN TIME: {run_times[algorithm_index]}ns\tMEM USAGE: {mem_usages[algorithm_index]}')
+            # The memory pass keeps its model, so retained bytes is the index
+            timing, memory, model = run_test(lambda: algorithm(dataset), rounds, warmup)
+            records.append({'phase': 'setup',
+                            'algorithm': algorithm.__algorithm_name__,
+                            'dataset': dataset_index,
+                            **timing, **memory})
+            models[algorithm_index].append(model)
+
+            print(f'\t\tRUN TIME: {timing["median_ns"]:.0f}ns '
+                  f'({benchmark.CONFIDENCE:.0%} CI {timing["ci_low_ns"]:.0f}-{timing["ci_high_ns"]:.0f}ns)'
+                  f'\tMEM RETAINED: {memory["retained_bytes"]}b\tMEM PEAK: {memory["peak_bytes"]}b')
+
+            if profile and hasattr(algorithm, 'enable_profiling'):
+                # One more build, untimed, for the phase timings
+                stats = algorithm(dataset, profile=True).stats()
+                stats = {name: value for name, value in stats.items() if name.startswith('build_')}
+                records[-1].update(stats)
+                print(profiling.format_stats(stats))
     
-    return run_times, mem_usages, models
+    return records, models
 
-def test_harness(algorithms, datasets, query_size_range, unique_queries_per_size, rounds=1):
+def test_harness(algorithms, datasets, query_size_range, unique_queries_per_size, rounds=1, warmup=1,
+                 profile=False):
     print(f'GENERATING QUERYSETS...')
     querysets = [[[get_random_substring(dataset, query_size)
                     for _ in range(unique_queries_per_size)]
@@ -124,9 +196,17 @@ def test_harness(algorithms, datasets, query_size_range, unique_queries_per_size
                     for dataset in datasets]
 
     print(f'TESTING SETUP TIMES')
-    setup_run_times, setup_mem_usages, models = test_setup(algorithms, datasets, rounds)
+    setup_records, models = test_setup(algorithms, datasets, rounds, warmup, profile)
     print(f'SETUP TIMES COMPLETE')
 
+    setup_run_times = [[] for _ in range(len(algorithms))]
+    setup_mem_usages = [[] for _ in range(len(algorithms))]
+    for record in setup_records:
+        algorithm_index = [a.__algorithm_name__ for a in algorithms].index(record['algorithm'])
+        setup_run_times[algorithm_index].append(record['median_ns'])
+        setup_mem_usages[algorithm_index].append(record['retained_bytes'])
+
+    align_records = []
     align_run_times = [[] for _ in range(len(algorithms))]
     align_mem_usages = [[] for _ in range(len(algorithms))]
 
@@ -136,42 +216,270 @@ def test_harness(algorithms, datasets, query_size_range, unique_queries_per_size
             _run_times = []
             _mem_usages = []
             for queryset in querysets[dataset_index]:
-                run_times, mem_usages = test_queryset_for_model(dataset_model, queryset, rounds)
-                _run_times.append(np.mean(run_times))
-                _mem_usages.append(np.mean(mem_usages))
+                records = test_queryset_for_model(dataset_model, queryset, rounds, warmup, profile)
+                for record in records:
+                    record['dataset'] = dataset_index
+                align_records += records
+                _run_times.append(np.mean([record['median_ns'] for record in records]))
+                _mem_usages.append(np.mean([record['peak_bytes'] for record in records]))
             align_run_times[algorithm_index].append(_run_times)
             align_mem_usages[algorithm_index].append(_mem_usages)
     print(f'ALIGNMENT TIMES COMPLETE')
 
-    return setup_run_times, setup_mem_usages, align_run_times, align_mem_usages
+    return setup_run_times, setup_mem_usages, align_run_times, align_mem_usages, setup_records + align_records
+
+def get_scaling_sizes(length, start, factor):
+    sizes = []
+    size = start
+    while size < length:
+        sizes.append(int(size))
+        size *= factor
+    sizes.append(length)
+    return sizes
+
+def fit_exponent(sizes, values):
+    # Slope of log(value) against log(n); None without two usable points
+    points = [(n, v) for n, v in zip(sizes, values) if v > 0]
+    if len(points) < 2:
+        return None
+    return np.polyfit(np.log([n for n, _ in points]), np.log([v for _, v in points]), 1)[0]
+
+def test_scaling(algorithms, dataset, sizes, query_size, queries_per_size, rounds=1, warmup=1,
+                 time_budget=60, memory_budget=2**30):
+    records = []
+
+    for algorithm in algorithms:
+        name = algorithm.__algorithm_name__
+        points = []
+        for size in sizes:
+            if points:
+                # Extrapolate from the sizes so far (at least linearly) and
+                # skip a build that would blow the budget
+                done = [point['size'] for point in points]
+                last = points[-1]
+                growth = size / last['size']
+                time_exponent = max(fit_exponent(done, [p['median_ns'] for p in points]) or 1, 1)
+                memory_exponent = max(fit_exponent(done, [p['retained_bytes'] for p in points]) or 1, 1)
+                if (last['median_ns'] * growth ** time_exponent / 1e9 > time_budget or
+                        last['retained_bytes'] * growth ** memory_exponent > memory_budget):
+                    print(f'\tSKIPPING {name} FROM {size} BASES: PREDICTED OVER BUDGET')
+                    break
+
+            print(f'\tSCALING {name} ON {size} BASES')
+            prefix = dataset[:size]
+            timing, memory, model = run_test(lambda: algorithm(prefix), rounds, warmup)
+            queries = [get_random_substring(prefix, min(query_size, size)) for _ in range(queries_per_size)]
+            latency = np.median([benchmark.time_function(lambda: model.align(query), rounds, warmup)['median_ns']
+                                 for query in queries])
+            del model
+
+            points.append({'phase': 'scaling',
+                           'algorithm': name,
+                           'size': size,
+                           'query_latency_ns': latency,
+                           **timing, **memory})
+            print(f'\t\tBUILD: {timing["median_ns"]:.0f}ns\tRETAINED: {memory["retained_bytes"]}b '
+                  f'({memory["retained_bytes"] / size:.1f}b/base)\tQUERY: {latency:.0f}ns')
+
+            if timing['median_ns'] / 1e9 > time_budget or memory['retained_bytes'] > memory_budget:
+                print(f'\tSKIPPING {name} FROM NOW ON: OVER BUDGET')
+                break
+
+        done = [point['size'] for point in points]
+        exponents = {'build_exponent': fit_exponent(done, [p['median_ns'] for p in points]),
+                     'memory_exponent': fit_exponent(done, [p['retained_bytes'] for p in points]),
+                     'query_exponent': fit_exponent(done, [p['query_latency_ns'] for p in points])}
+        for point in points:
+            point.update(exponents)
+        records += points
+        print(f'\t{name}: ' + '  '.join(f'{field} {value:.2f}' for field, value in exponents.items()
+                                        if value is not None))
+
+    return records
+
+def plot_scaling(records, algorithms, dataset_names, out_file, width, height):
+    fig, axs = plt.subplots(3, 1, figsize=(width, height * 1.5))
+    fig.tight_layout(pad=3.0)
+
+    for algorithm in algorithms:
+        for dataset_index, dataset_name in enumerate(dataset_names):
+            points = [record for record in records
+                      if record['algorithm'] == algorithm.__algorithm_name__ and record['dataset'] == dataset_index]
+            if not points:
+                continue
+            sizes = [point['size'] for point in points]
+            label = f'{algorithm.__algorithm_name__} on {dataset_name}'
+            for ax, field, values in (
+                    (axs[0], 'build_exponent', [point['median_ns'] for point in points]),
+                    (axs[1], 'memory_exponent', [point['retained_bytes'] / point['size'] for point in points]),
+                    (axs[2], 'query_exponent', [point['query_latency_ns'] for point in points])):
+                exponent = points[0][field]
+                if exponent is not None:
+                    label_with_fit = f'{label} (n^{exponent:.2f})'
+                else:
+                    label_with_fit = label
+                ax.loglog(sizes, values, marker='o', label=label_with_fit)
+
+    axs[0].set_title(f'Scaling With Reference Size')
+    for ax, ylabel in zip(axs, ['Build time (ns)', 'Memory per base (bytes)', 'Query latency (ns)']):
+        ax.set_xlabel('Reference size (bases)')
+        ax.set_ylabel(ylabel)
+        ax.legend(loc='best', frameon=False, fontsize='small')
+        ax.spines['top'].set_visible(False)
+        ax.spines['right'].set_visible(False)
+
+    fig.savefig(f'{out_file.split(".png")[0]}_scaling.png')
+
+def run_scaling(args, algorithms):
+    print(f'READING DATASETS')
+    datasets = [record_table.join_records(utils.iter_fasta(dataset)) for dataset in args.reference]
+    print(f'DATASETS READ')
+    benchmark.seed_everything(args.seed)
+
+    print(f'RUNNING SCALING SWEEP NOW\n————————————')
+    records = []
+    for dataset_index, (dataset, _) in enumerate(datasets):
+        sizes = get_scaling_sizes(len(dataset), args.scaling_start, args.scaling_factor)
+        dataset_records = test_scaling(algorithms, dataset, sizes,
+                                       query_size=args.scaling_query_size,
+                                       queries_per_size=args.queries_per_size,
+                                       rounds=args.rounds,
+                                       warmup=args.warmup,
+                                       time_budget=args.time_budget,
+                                       memory_budget=args.memory_budget * 2**20)
+        for record in dataset_records:
+            record['dataset'] = dataset_index
+        records += dataset_records
+    print(f'SCALING SWEEP COMPLETE')
+
+    plot_scaling(records, algorithms, [str(table) for _, table in datasets], args.out_file, args.width, args.height)
+    return records
+
+def test_sparse(dataset, steps, queries, rounds=1, warmup=1):
+    records = []
+
+    for step in steps:
+        print(f'\tSPARSE SUFFIX ARRAY WITH STEP {step}')
+        timing, memory, model = run_test(lambda: SuffixArray(dataset, sparse_step=step), rounds, warmup)
+        latency = np.median([benchmark.time_function(lambda: model.count(query), rounds, warmup)['median_ns']
+                             for query in queries])
+        del model
+
+        records.append({'phase': 'sparse',
+                        'algorithm': SuffixArray.__algorithm_name__,
+                        'sparse_step': step,
+                        'query_size': len(queries[0]),
+                        'query_latency_ns': latency,
+                        **timing, **memory})
+        print(f'\t\tBUILD: {timing["median_ns"]:.0f}ns\tRETAINED: {memory["retained_bytes"]}b'
+              f'\tQUERY: {latency:.0f}ns')
+
+    return records
+
+def plot_sparse(records, dataset_names, out_file, width, height):
+    fig, ax = plt.subplots(figsize=(width, height))
+    fig.tight_layout(pad=3.0)
+
+    for dataset_index, dataset_name in enumerate(dataset_names):
+        points = [record for record in records if record['dataset'] == dataset_index]
+        memory = [point['retained_bytes'] for point in points]
+        latency = [point['query_latency_ns'] for point in points]
+        ax.plot(memory, latency, marker='o', label=dataset_name)
+        for point, x, y in zip(points, memory, latency):
+            ax.annotate(f's={point["sparse_step"]}', (x, y), textcoords='offset points', xytext=(4, 4),
+                        fontsize='small')
+
+    ax.set_xscale('log')
+    ax.set_yscale('log')
+    ax.set_title('Sparse Suffix Array: Memory vs Query Latency')
+    ax.set_xlabel('Index memory (bytes)')
+    ax.set_ylabel('Query latency (ns)')
+    ax.legend(loc='best', frameon=False)
+    ax.spines['top'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+
+    fig.savefig(f'{out_file.split(".png")[0]}_sparse.png')
+
+def run_sparse(args):
+    print(f'READING DATASETS')
+    datasets = [record_table.join_records(utils.iter_fasta(dataset)) for dataset in args.reference]
+    print(f'DATASETS READ')
+    benchmark.seed_everything(args.seed)
+
+    print(f'RUNNING SPARSE SUFFIX ARRAY SWEEP NOW\n————————————')
+    records = []
+    for dataset_index, (dataset, _) in enumerate(datasets):
+        queries = [get_random_substring(dataset, args.sparse_query_size) for _ in range(args.queries_per_size)]
+        dataset_records = test_sparse(dataset, args.sparse_steps, queries, args.rounds, args.warmup)
+        for record in dataset_records:
+            record['dataset'] = dataset_index
+        records += dataset_records
+    print(f'SPARSE SUFFIX ARRAY SWEEP COMPLETE')
+
+    plot_sparse(records, [str(table) for _, table in datasets], args.out_file, args.width, args.height)
+    return records
+
+def report_regressions(args, records):
+    # Regressions of records against --baseline, printed; none without one
+    if not args.baseline:
+        return []
+    regressions = benchmark.compare_results(records, benchmark.read_results(args.baseline), args.threshold)
+    for regression in regressions:
+        print(f'REGRESSION {regression["key"]} {regression["field"]}: '
+              f'{regression["baseline"]:.0f} -> {regression["current"]:.0f} ({regression["ratio"]:.2f}x)')
+    print(f'{len(regressions)} REGRESSIONS OVER {args.threshold:.0%} AGAINST {args.baseline}')
+    return regressions
 
 def main():
     args = get_args()
 
+    algorithms = [SuffixTrie, SuffixAutomaton, SuffixTree, LazySuffixTree, SuffixArray, EnhancedSuffixArray,
+                  FMIndex]
+
+    if args.scaling or args.sparse_steps:
+        records = run_scaling(args, algorithms) if args.scaling else run_sparse(args)
+        if args.results:
+            benchmark.write_results(args.results, records)
+            print(f'RESULTS WRITTEN TO {args.results}')
+        if report_regressions(args, records):
+            sys.exit(1)
+        return
+    if args.query_size is None:
+        sys.exit('evaluation.py: --query_size is required unless --scaling or --sparse_steps is given')
+
     # Define parameters
     query_size_range = range(args.query_size[0],
                              args.query_size[1],
                              args.query_size[2])
 
-    algorithms = [SuffixTrie, SuffixTree, SuffixArray]
-
     print(f'READING DATASETS')
-    datasets = [utils.read_fasta(dataset)[0] for dataset in args.reference]
-    datasets_name = [dataset[0] for dataset in datasets]
-    datasets_content = [dataset[1][:5000] for dataset in datasets]
+    # Every record of a file is indexed, joined into one text
+    datasets = [record_table.join_records(utils.iter_fasta(dataset, max_bases=5000))
+                for dataset in args.reference]
+    datasets_name = [str(table) for _, table in datasets]
+    datasets_content = [text for text, _ in datasets]
     print(f'DATASETS READ')
 
     unique_queries_per_size = args.queries_per_size
     rounds = args.rounds
+    benchmark.seed_everything(args.seed)
 
     # Run experiment
     print(f'RUNNING EXPERIMENT NOW\n————————————')
-    setup_run_times, setup_mem_usages, align_run_times, align_mem_usages = test_harness(
+    setup_run_times, setup_mem_usages, align_run_times, align_mem_usages, records = test_harness(
         algorithms=algorithms,
         datasets=datasets_content,
         query_size_range=query_size_range,
         unique_queries_per_size=unique_queries_per_size,
-        rounds=rounds)
+        rounds=rounds,
+        warmup=args.warmup,
+        profile=args.profile)
+
+    if args.results:
+        benchmark.write_results(args.results, records)
+        print(f'RESULTS WRITTEN TO {args.results}')
+
+    regressions = report_regressions(args, records)
     
     # Present results
     # Generation performance
@@ -192,7 +500,7 @@ def main():
 
     axs[0].set_title(f'Data Structure Generation Performance')
     axs[0].set_xlabel('Database')
-    axs[0].set_ylabel('Run time (ns)')
+    axs[0].set_ylabel('Median run time (ns)')
     axs[0].legend(loc='best', frameon=False, ncol=3)
     axs[0].spines['top'].set_visible(False)
     axs[0].spines['right'].set_visible(False)
@@ -200,7 +508,7 @@ def main():
     axs[0].set_xticklabels(algorithm_names)
 
     axs[1].set_xlabel('Query size')
-    axs[1].set_ylabel('Memory (bytes)')
+    axs[1].set_ylabel('Retained memory (bytes)')
     axs[1].legend(loc='best', frameon=False, ncol=3)
     axs[1].spines['top'].set_visible(False)
     axs[1].spines['right'].set_visible(False)
@@ -221,18 +529,21 @@ def main():
 
     axs[0].set_title(f'String Alignment Performance')
     axs[0].set_xlabel('Query size')
-    axs[0].set_ylabel('Run time (ns)')
+    axs[0].set_ylabel('Median run time (ns)')
     axs[0].legend(loc='best', frameon=False, ncol=3)
     axs[0].spines['top'].set_visible(False)
     axs[0].spines['right'].set_visible(False)
 
     axs[1].set_xlabel('Query size')
-    axs[1].set_ylabel('Memory (bytes)')
+    axs[1].set_ylabel('Peak memory (bytes)')
     axs[1].legend(loc='best', frameon=False, ncol=3)
     axs[1].spines['top'].set_visible(False)
     axs[1].spines['right'].set_visible(False)
 
     fig.savefig(f'{args.out_file.split(".png")[0]}_alignment.png')
 
+    if regressions:
+        sys.exit(1)
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
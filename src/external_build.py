@@ -0,0 +1,233 @@
+import os
+import tempfile
+import numpy as np
+
+# Suffix array construction on disk: prefix doubling where every round is
+# an external sort. (key, value) records are sorted into runs that fit the
+# memory budget, the runs are merged a block at a time and the new ranks are
+# written back in text order through partition files, so the working arrays
+# never have to be resident at once. Files are read and written with plain
+# I/O rather than memory maps, so the page cache does not count towards the
+# resident set.
+
+RECORD = np.dtype([('key', '<u8'), ('value', '<i8')])
+ITEM_BYTES = 64 # Working bytes per record while a block is sorted
+MIN_ITEMS = 1 << 12
+MAX_FILES = 64 # Scratch files open at once by a merge or a partitioning pass
+MAX_KMER = 16 # Characters compared by the first round
+
+def read_block(f, dtype, start, count):
+    f.seek(start * np.dtype(dtype).itemsize)
+    return np.fromfile(f, dtype=dtype, count=count)
+
+def write_runs(blocks, run_items, scratch, prefix):
+    # Sorted runs of up to about run_items records, one file each
+    paths, buffer, size = [], [], 0
+
+    def flush():
+        records = np.concatenate(buffer)
+        records = records[np.argsort(records['key'], kind='stable')]
+        path = os.path.join(scratch, f'{prefix}{len(paths)}')
+        records.tofile(path)
+        paths.append(path)
+        buffer.clear()
+
+    for block in blocks:
+        buffer.append(block)
+        size += len(block)
+        if size >= run_items:
+            flush()
+            size = 0
+    if buffer:
+        flush()
+    return paths
+
+class RunReader():
+    def __init__(self, path, block_items):
+        self.file, self.block_items = open(path, 'rb'), block_items
+        self.buffer, self.exhausted = np.empty(0, dtype=RECORD), False
+        self.fill()
+
+    def fill(self):
+        wanted = self.block_items - len(self.buffer)
+        if self.exhausted or wanted <= 0:
+            return
+        more = np.fromfile(self.file, dtype=RECORD, count=wanted)
+        if len(more) < wanted:
+            self.exhausted = True
+            self.file.close()
+        self.buffer = np.concatenate((self.buffer, more))
+
+def merge_passes(paths, run_items, scratch, fan_in):
+    # Merge groups of fan_in runs into longer runs until at most fan_in are
+    # left, so that the final merge holds one block per run in memory
+    passes = 0
+    while len(paths) > fan_in:
+        block_items = run_items // (fan_in + 1)
+        merged_paths = []
+        for start in range(0, len(paths), fan_in):
+            group = paths[start:start + fan_in]
+            merged_path = os.path.join(scratch, f'merge{passes}_{len(merged_paths)}')
+            with open(merged_path, 'wb') as f:
+                for records in merge_runs(group, block_items):
+                    records.tofile(f)
+            for path in group:
+                os.remove(path)
+            merged_paths.append(merged_path)
+        paths, passes = merged_paths, passes + 1
+    return paths
+
+def merge_runs(paths, block_items):
+    # Records of all runs in key order, as blocks. Each step emits every
+    # buffered record up to the smallest last key among the runs that still
+    # have unread records, since nothing unread can sort below it.
+    readers = [RunReader(path, block_items) for path in paths]
+    while True:
+        readers = [reader for reader in readers if len(reader.buffer)]
+        if not readers:
+            return
+        bounds = [reader.buffer['key'][-1] for reader in readers if not reader.exhausted]
+        if bounds:
+            bound = min(bounds)
+            takes = [int(np.searchsorted(reader.buffer['key'], bound, side='right')) for reader in readers]
+        else:
+            takes = [len(reader.buffer) for reader in readers]
+
+        merged = np.concatenate([reader.buffer[:take] for reader, take in zip(readers, takes)])
+        for reader, take in zip(readers, takes):
+            reader.buffer = reader.buffer[take:]
+            reader.fill()
+        yield merged[np.argsort(merged['key'], kind='stable')]
+
+def file_blocks(path, block_items):
+    with open(path, 'rb') as f:
+        while True:
+            records = np.fromfile(f, dtype=RECORD, count=block_items)
+            if len(records) == 0:
+                return
+            yield records
+
+def write_by_position(blocks, n, part_items, scratch, path, dtype, fan_out):
+    # Write the value of every (position, value) record, one per position,
+    # to its position in path
+    with open(path, 'wb') as out:
+        scatter_range(blocks, 0, n, part_items, scratch, out, dtype, fan_out, 0)
+
+def scatter_range(blocks, lo, hi, part_items, scratch, out, dtype, fan_out, depth):
+    # Records of positions [lo, hi) are scattered in memory once they fit in
+    # part_items; until then they are spread over at most fan_out files of
+    # consecutive positions, each handled the same way
+    if hi - lo <= part_items:
+        values = np.empty(hi - lo, dtype=dtype)
+        for records in blocks:
+            values[records['key'].astype(np.int64) - lo] = records['value']
+        values.tofile(out)
+        return
+
+    span = max(-(-(hi - lo) // fan_out), part_items)
+    parts = -(-(hi - lo) // span)
+    part_paths = [os.path.join(scratch, f'part{depth}_{lo + i * span}') for i in range(parts)]
+    part_files = [open(part_path, 'wb') for part_path in part_paths]
+    try:
+        for records in blocks:
+            part = (records['key'].astype(np.int64) - lo) // span
+            records = records[np.argsort(part, kind='stable')]
+            counts = np.bincount(part, minlength=parts)
+            for part_file, piece in zip(part_files, np.split(records, np.cumsum(counts)[:-1])):
+                if len(piece):
+                    piece.tofile(part_file)
+    finally:
+        for part_file in part_files:
+            part_file.close()
+
+    for i, part_path in enumerate(part_paths):
+        start = lo + i * span
+        scatter_range(file_blocks(part_path, part_items), start, min(start + span, hi),
+                      part_items, scratch, out, dtype, fan_out, depth + 1)
+        os.remove(part_path)
+
+def initial_records(chunk_codes, n, alphabet, k, block_items):
+    # Key of every suffix: its first k characters as digits, 0 past the end
+    base = len(alphabet) + 1
+    for start in range(0, n, block_items):
+        stop = min(start + block_items, n)
+        window = np.zeros(stop - start + k - 1, dtype=np.uint64)
+        codes = chunk_codes(start, min(stop + k - 1, n))
+        window[:len(codes)] = np.searchsorted(alphabet, codes) + 1
+        records = np.zeros(stop - start, dtype=RECORD)
+        keys = records['key']
+        for j in range(k):
+            keys *= np.uint64(base)
+            keys += window[j:j + stop - start]
+        records['value'] = np.arange(start, stop)
+        yield records
+
+def pair_records(rank_path, n, h, dtype, block_items):
+    # Key of every suffix for the next round: its rank and the rank h
+    # characters on, -1 past the end
+    with open(rank_path, 'rb') as f:
+        for start in range(0, n, block_items):
+            stop = min(start + block_items, n)
+            first = read_block(f, dtype, start, stop - start).astype(np.uint64)
+            second = np.zeros(stop - start, dtype=np.uint64)
+            if start + h < n:
+                after = read_block(f, dtype, start + h, min(stop + h, n) - start - h)
+                second[:len(after)] = after.astype(np.uint64) + 1
+            records = np.empty(stop - start, dtype=RECORD)
+            records['key'] = first * np.uint64(n + 1) + second
+            records['value'] = np.arange(start, stop)
+            yield records
+
+def ranked_positions(paths, block_items, out, out_offset, dtype, counter):
+    # Merge the runs, write their positions in order to out (the suffix
+    # array so far) and yield (position, dense rank) records; counter[0]
+    # ends up as the number of distinct ranks
+    out.seek(out_offset)
+    previous, rank = None, -1
+    for records in merge_runs(paths, block_items):
+        keys = records['key']
+        new = np.empty(len(keys), dtype=bool)
+        new[0] = previous is None or keys[0] != previous
+        np.not_equal(keys[1:], keys[:-1], out=new[1:])
+        ranks = rank + np.cumsum(new)
+        rank, previous = int(ranks[-1]), keys[-1]
+        records['value'].astype(dtype).tofile(out)
+
+        ranked = np.empty(len(records), dtype=RECORD)
+        ranked['key'], ranked['value'] = records['value'], ranks
+        yield ranked
+    counter[0] = rank + 1
+
+def sort_suffixes_external(chunk_codes, n, out_path, out_offset, dtype, memory_budget, scratch_dir=None):
+    # Suffix array of a text of n codes, read through chunk_codes(start,
+    # stop), written as dtype at out_offset of the file out_path. Working
+    # memory stays within about memory_budget bytes and at most MAX_FILES
+    # scratch files are open at once; they go to scratch_dir (default: the
+    # system temporary directory).
+    if n >= 2**32:
+        raise ValueError('External construction supports texts below 2**32 characters')
+    run_items = max(memory_budget // ITEM_BYTES, MIN_ITEMS)
+    # Runs merged at once: each needs a block of at least MIN_ITEMS records
+    fan_in = max(2, min(MAX_FILES, run_items // MIN_ITEMS - 1))
+
+    alphabet = np.empty(0, dtype=np.int64)
+    for start in range(0, n, run_items):
+        alphabet = np.union1d(alphabet, chunk_codes(start, min(start + run_items, n)))
+    k = int(min(MAX_KMER, max(63 // np.log2(len(alphabet) + 1), 1)))
+
+    with tempfile.TemporaryDirectory(dir=scratch_dir) as scratch, open(out_path, 'r+b') as out:
+        rank_path = os.path.join(scratch, 'ranks')
+        runs = write_runs(initial_records(chunk_codes, n, alphabet, k, run_items), run_items, scratch, 'run')
+        h = k
+        while True:
+            counter = [0]
+            runs = merge_passes(runs, run_items, scratch, fan_in)
+            block_items = run_items // (len(runs) + 1)
+            write_by_position(ranked_positions(runs, block_items, out, out_offset, dtype, counter),
+                              n, run_items, scratch, rank_path, dtype, MAX_FILES)
+            for path in runs:
+                os.remove(path)
+            if counter[0] == n:
+                return
+            runs = write_runs(pair_records(rank_path, n, h, dtype, run_items), run_items, scratch, 'run')
+            h *= 2
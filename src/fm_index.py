@@ -0,0 +1,160 @@
+import argparse
+import numpy as np
+import record_table
+import utils
+from suffix_array import SuffixArray, index_dtype, text_codes
+
+def get_args():
+    parser = argparse.ArgumentParser(description='FM index')
+
+    parser.add_argument('--reference',
+                        help='Reference sequence file',
+                        type=str)
+
+    parser.add_argument('--string',
+                        help='Reference sequence',
+                        type=str)
+
+    parser.add_argument('--query',
+                        help='Query sequences',
+                        nargs='+',
+                        type=str)
+
+    parser.add_argument('--locate',
+                        help='Print up to this many hits of each query as record:offset',
+                        type=int)
+
+    return parser.parse_args()
+
+class FMIndex():
+    __algorithm_name__ = 'FM index'
+    OCC_STEP = 128 # BWT rows between occurrence checkpoints
+    SA_STEP = 32 # Text positions between suffix array samples
+
+    def __init__(self, T: str = None, occ_step=OCC_STEP, sa_step=SA_STEP, records=None):
+        self.occ_step, self.sa_step = occ_step, sa_step
+        self.records = records # RecordTable when T joins several records
+        self.bwt, self.C, self.occ = None, None, None
+        self.char_codes = None # Byte of each character, for texts beyond ASCII
+        self.sample_rows, self.sample_positions = None, None
+        if T is not None:
+            self.setup(T)
+
+    def setup(self, T):
+        # Only the BWT, the checkpoints and the samples are kept; the full
+        # suffix array is dropped once they are derived from it
+        array = SuffixArray(T).array
+        self.build_bwt(T + '$', array)
+        self.build_samples(array)
+
+    def align(self, query):
+        return self.count(query)
+
+    def count(self, q):
+        if not q:
+            return len(self.bwt) - 1 # Every position but the '$' sentinel
+        lo, hi = self.backward_search(q)
+        return hi - lo
+
+    def build_bwt(self, T, array):
+        text = text_codes(T)
+        if text.dtype != np.uint8:
+            # Wider code points are renumbered in order, so the BWT stays one
+            # byte per row and sorts the same; queries go through the same table
+            alphabet = np.unique(text)
+            if len(alphabet) > 256:
+                raise ValueError(f'FMIndex needs at most 256 distinct characters, the text has {len(alphabet)}')
+            self.char_codes = {chr(c): i for i, c in enumerate(alphabet.tolist())}
+            text = np.searchsorted(alphabet, text).astype(np.uint8)
+        bwt = text[array - 1] # array - 1 wraps to the '$' for suffix 0
+        self.bwt = bwt.tobytes()
+
+        # C[c] = number of characters smaller than c; occ[c][k] = number of c
+        # in bwt[:k * occ_step]
+        counts = np.bincount(bwt, minlength=256)
+        self.C = (np.cumsum(counts) - counts).tolist()
+        self.occ = {}
+        for c in np.flatnonzero(counts).tolist():
+            running = np.zeros(len(bwt) + 1, dtype=index_dtype(len(bwt)))
+            np.cumsum(bwt == c, out=running[1:])
+            self.occ[c] = running[::self.occ_step].copy()
+
+    def build_samples(self, array):
+        # Rows whose suffix starts at a multiple of sa_step, in row order
+        self.sample_rows = np.flatnonzero(array % self.sa_step == 0).astype(array.dtype)
+        self.sample_positions = array[self.sample_rows]
+
+    def rank(self, c, i):
+        # Occurrences of byte c in bwt[:i]
+        block = i // self.occ_step
+        return int(self.occ[c][block]) + self.bwt.count(c, block * self.occ_step, i)
+
+    def lf(self, i):
+        c = self.bwt[i]
+        return self.C[c] + self.rank(c, i)
+
+    def query_bytes(self, q):
+        # q in the bytes of the BWT, or None if it has a character the text
+        # does not
+        if self.char_codes is None:
+            return q.encode('ascii') if q.isascii() else None
+        codes = [self.char_codes.get(c) for c in q]
+        return None if None in codes else bytes(codes)
+
+    def backward_search(self, q):
+        # Half-open range of BWT rows whose suffixes start with q
+        query = self.query_bytes(q)
+        if query is None:
+            return 0, 0
+        lo, hi = 0, len(self.bwt)
+        for c in reversed(query):
+            if c not in self.occ:
+                return 0, 0
+            lo = self.C[c] + self.rank(c, lo)
+            hi = self.C[c] + self.rank(c, hi)
+            if lo >= hi:
+                return 0, 0
+        return lo, hi
+
+    def locate_row(self, i):
+        # Walk LF until a sampled row; each step moves one position left
+        steps = 0
+        while True:
+            sample = int(np.searchsorted(self.sample_rows, i))
+            if sample < len(self.sample_rows) and self.sample_rows[sample] == i:
+                return int(self.sample_positions[sample]) + steps
+            i = self.lf(i)
+            steps += 1
+
+    def locate(self, q, limit=None, sort=False):
+        # Reference offsets of q; each one costs up to sa_step LF steps, so
+        # they are only resolved as they are consumed
+        if not q:
+            return utils.take_positions([np.arange(len(self.bwt) - 1)], limit, sort)
+        lo, hi = self.backward_search(q)
+        if limit is not None and not sort:
+            hi = min(hi, lo + limit)
+        return utils.take_positions((self.locate_row(i) for i in range(lo, hi)), limit, sort)
+
+def main():
+    args = get_args()
+
+    T, records = None, None
+
+    if args.string:
+        T = args.string
+    elif args.reference:
+        T, records = record_table.join_records(utils.iter_fasta(args.reference))
+
+    index = FMIndex(T, records=records)
+
+    if args.query:
+        for query in args.query:
+            match_count = index.align(query)
+            print(f'{query} : {match_count}')
+            if args.locate:
+                for record, offset in record_table.locate_records(index, query, args.locate, sort=True):
+                    print(f'\t{record}:{offset}')
+
+if __name__ == '__main__':
+    main()
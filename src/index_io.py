@@ -0,0 +1,123 @@
+import hashlib
+import json
+import struct
+import numpy as np
+from packed_dna import PackedDNA
+
+# Index file layout:
+#   MAGIC, then little-endian uint32 format version and uint32 header size
+#   JSON header: index kind, reference checksum, scalar fields and the dtype,
+#   shape and offset of every array section
+#   Array sections, each starting on an ALIGNMENT boundary after the header
+MAGIC = b'SUFXIDX\n'
+VERSION = 1
+ALIGNMENT = 64
+PREAMBLE = struct.Struct('<8sII')
+
+class IndexFormatError(ValueError):
+    pass
+
+def reference_checksum(T):
+    data = T.codes().tobytes() if isinstance(T, PackedDNA) else T.encode('utf-8')
+    return 'sha256:' + hashlib.sha256(data).hexdigest()
+
+def check_reference(path, T):
+    if read_header(path)['checksum'] != reference_checksum(T):
+        raise IndexFormatError(f'{path} was not built from this reference')
+
+def as_numpy(values):
+    if isinstance(values, np.ndarray):
+        return values
+    if isinstance(values, PackedDNA):
+        return values.codes()
+    if isinstance(values, str):
+        return np.frombuffer(values.encode('latin-1'), dtype=np.uint8)
+    return np.frombuffer(values, dtype=getattr(values, 'typecode', 'B'))
+
+def text_sections(T):
+    # Sections for an index's text: a packed text is saved packed, as
+    # text_packed, text_run_starts and so on
+    if isinstance(T, PackedDNA):
+        return {f'text_{name}': values for name, values in T.sections().items()}
+    return {'text': T}
+
+def read_text(sections):
+    # The text of a loaded index: a PackedDNA read in place from the memory
+    # maps, or the memory-mapped code array of a plain text
+    if 'text_packed' in sections:
+        return PackedDNA.from_sections({name[len('text_'):]: values for name, values in sections.items()
+                                        if name.startswith('text_')})
+    return sections['text']
+
+class Reserved():
+    # Section of known dtype and shape whose data is written into the file
+    # later, in place (see section_offset)
+    def __init__(self, dtype, shape):
+        self.dtype, self.shape = np.dtype(dtype), tuple(shape)
+        self.nbytes = int(np.prod(self.shape)) * self.dtype.itemsize
+
+def aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+def write_index(path, kind, checksum, sections, scalars=None):
+    # sections maps names to arrays (NumPy, array.array, bytes or str) or
+    # to Reserved placeholders, which are left zero-filled
+    sections = {name: values if isinstance(values, Reserved) else as_numpy(values)
+                for name, values in sections.items()}
+    layout, offset = {}, 0
+    for name, values in sections.items():
+        layout[name] = {'dtype': values.dtype.str, 'shape': list(values.shape), 'offset': offset}
+        offset = aligned(offset + values.nbytes)
+
+    header = json.dumps({'kind': kind,
+                         'checksum': checksum,
+                         'scalars': scalars or {},
+                         'sections': layout}).encode('utf-8')
+
+    with open(path, 'wb') as f:
+        f.write(PREAMBLE.pack(MAGIC, VERSION, len(header)))
+        f.write(header)
+        data_start = aligned(PREAMBLE.size + len(header))
+        for name, values in sections.items():
+            if isinstance(values, Reserved):
+                continue
+            f.seek(data_start + layout[name]['offset'])
+            values.tofile(f)
+        f.truncate(data_start + offset)
+
+def read_header(path):
+    with open(path, 'rb') as f:
+        preamble = f.read(PREAMBLE.size)
+        if len(preamble) < PREAMBLE.size:
+            raise IndexFormatError(f'{path} is not an index file')
+        magic, version, header_size = PREAMBLE.unpack(preamble)
+        if magic != MAGIC:
+            raise IndexFormatError(f'{path} is not an index file')
+        if version != VERSION:
+            raise IndexFormatError(f'{path} has index format version {version}, expected {VERSION}')
+        header = json.loads(f.read(header_size).decode('utf-8'))
+    header['data_start'] = aligned(PREAMBLE.size + header_size)
+    return header
+
+def section_offset(path, name):
+    # Byte offset of a section's data in the file
+    header = read_header(path)
+    return header['data_start'] + header['sections'][name]['offset']
+
+def read_index(path, kind):
+    # Header and read-only memory maps of every section; nothing is paged in
+    # until it is touched
+    header = read_header(path)
+    if header['kind'] != kind:
+        raise IndexFormatError(f'{path} holds a {header["kind"]}, not a {kind}')
+
+    sections = {}
+    for name, section in header['sections'].items():
+        shape = tuple(section['shape'])
+        if 0 in shape:
+            sections[name] = np.empty(shape, dtype=section['dtype'])
+        else:
+            sections[name] = np.memmap(path, dtype=section['dtype'], mode='r',
+                                       offset=header['data_start'] + section['offset'],
+                                       shape=shape)
+    return header, sections
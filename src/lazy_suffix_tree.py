@@ -0,0 +1,244 @@
+import argparse
+from array import array
+import numpy as np
+import record_table
+import utils
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Lazy suffix tree')
+
+    parser.add_argument('--reference',
+                        help='Reference sequence file',
+                        type=str)
+
+    parser.add_argument('--string',
+                        help='Reference sequence',
+                        type=str)
+
+    parser.add_argument('--query',
+                        help='Query sequences',
+                        nargs='+',
+                        type=str)
+
+    parser.add_argument('--max_nodes',
+                        help='Drop the deepest nodes, keeping the top levels, once there are more than this many',
+                        type=int)
+
+    parser.add_argument('--locate',
+                        help='Print up to this many hits of each query as record:offset',
+                        type=int)
+
+    return parser.parse_args()
+
+class LazySuffixTree():
+    # Write-only top-down suffix tree (Giegerich, Kurtz and Stoye): nothing
+    # is built up front. Every node owns a range of the suffixes array, the
+    # suffixes below it, and a node is only expanded into children when a
+    # search first walks through it, so the tree grows with the queries.
+    __algorithm_name__ = 'Lazy suffix tree'
+    ROOT = 0
+    NONE = -1
+    NODE_TYPE = 'i'
+    COLUMNS = ('start', 'end', 'depth', 'lo', 'hi', 'first_child', 'next_sibling')
+
+    def __init__(self, s: str = None, max_nodes=None, records=None):
+        self.s = None
+        self.max_nodes = max_nodes # Cap on nodes, checked between searches; see prune
+        self.records = records # RecordTable when s joins several records
+        if s is not None:
+            self.setup(s)
+
+    def setup(self, s):
+        # The text as bytes with a 0 past its end, so that every suffix can
+        # be read one character beyond its last, and the suffix indexes
+        self.s = s
+        n = len(s)
+        self.codes = np.zeros(n + 1, dtype=np.uint8)
+        self.codes[:n] = np.frombuffer(s.encode('latin-1'), dtype=np.uint8)
+        self.suffixes = np.arange(n, dtype=np.int32 if n < 2**31 else np.int64)
+        self.collapse()
+
+    def align(self, query):
+        return self.search_tree(query)
+
+    def collapse(self):
+        # Back to an unexpanded root that owns every suffix
+        for column in self.COLUMNS:
+            setattr(self, column, array(self.NODE_TYPE))
+        self.expanded = bytearray()
+        self.new_node(0, 0, 0, 0, len(self.suffixes))
+
+    def new_node(self, start, end, depth, lo, hi):
+        # start:end is the label of the edge into the node, depth the length
+        # of its path and suffixes[lo:hi] the suffixes below it
+        for column, value in zip(self.COLUMNS, (start, end, depth, lo, hi, self.NONE, self.NONE)):
+            getattr(self, column).append(value)
+        self.expanded.append(False)
+        return len(self.start) - 1
+
+    def prune(self):
+        # Drop the deepest nodes once there are more than max_nodes. Whole
+        # levels are kept from the top, as many as fit in half the cap and at
+        # least the root's children, and the nodes of the last kept level go
+        # back to unexpanded. Their suffix ranges are still valid, so later
+        # searches only re-expand below them.
+        levels, kept = [[self.ROOT]], 1
+        while True:
+            level = [child for node in levels[-1] for child in self.children(node)]
+            if not level or (len(levels) > 1 and kept + len(level) > self.max_nodes // 2):
+                break
+            levels.append(level)
+            kept += len(level)
+
+        nodes = [node for level in levels for node in level]
+        new_id = {node: i for i, node in enumerate(nodes)}
+        columns, expanded = {column: getattr(self, column) for column in self.COLUMNS}, self.expanded
+        links = ('first_child', 'next_sibling')
+        for column in self.COLUMNS:
+            values = columns[column]
+            if column in links:
+                kept_values = (new_id.get(values[node], self.NONE) for node in nodes)
+            else:
+                kept_values = (values[node] for node in nodes)
+            setattr(self, column, array(self.NODE_TYPE, kept_values))
+        self.expanded = bytearray(expanded[node] and self.first_child[new_id[node]] != self.NONE
+                                  or self.hi[new_id[node]] - self.lo[new_id[node]] == 1 for node in nodes)
+
+    def children(self, node):
+        child = self.first_child[node]
+        while child != self.NONE:
+            yield child
+            child = self.next_sibling[child]
+
+    def add_child(self, node, child):
+        self.next_sibling[child] = self.first_child[node]
+        self.first_child[node] = child
+
+    def get_child(self, node, c):
+        if not self.expanded[node]:
+            self.expand(node)
+        T, start, next_sibling = self.s, self.start, self.next_sibling
+        child = self.first_child[node]
+        while child != self.NONE and T[start[child]] != c:
+            child = next_sibling[child]
+        return child
+
+    def expand(self, node):
+        # Partition the node's suffixes on their next character. Suffixes
+        # that end at the node sort first and get no child; every other group
+        # becomes a child whose edge runs as far as its suffixes agree.
+        codes, depth = self.codes, self.depth[node]
+        lo, hi = self.lo[node], self.hi[node]
+        block = self.suffixes[lo:hi]
+        keys = codes[block + depth]
+        order = np.argsort(keys, kind='stable')
+        block[:] = block[order]
+        keys = keys[order]
+
+        bounds = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+        groups = zip([0, *bounds.tolist()], [*bounds.tolist(), len(block)]) if len(block) else ()
+        for a, b in groups:
+            if keys[a] == 0:
+                continue
+            group = block[a:b]
+            first = int(group[0])
+            if b - a == 1:
+                child_depth = len(self.s) - first
+            else:
+                child_depth = depth + 1
+                while True:
+                    c = codes[group + child_depth]
+                    if c[0] == 0 or (c != c[0]).any():
+                        break
+                    child_depth += 1
+            child = self.new_node(first + depth, first + child_depth, child_depth, lo + a, lo + b)
+            self.expanded[child] = b - a == 1 # A leaf has nothing to expand
+            self.add_child(node, child)
+        self.expanded[node] = True
+
+    def find_locus(self, q):
+        # Node at or below the end of q's path, or NONE if q does not occur
+        if self.max_nodes is not None and len(self.start) > self.max_nodes:
+            self.prune()
+        T, start, end = self.s, self.start, self.end
+
+        n = self.ROOT
+        i = 0
+
+        while i < len(q):
+            n = self.get_child(n, q[i])
+            if n == self.NONE:
+                return n
+
+            j = start[n]
+            while i < len(q) and j < end[n] and q[i] == T[j]:
+                i += 1
+                j += 1
+
+            if i < len(q) and j < end[n]:
+                return self.NONE
+
+        return n
+
+    def count(self, q):
+        node = self.find_locus(q)
+        return 0 if node == self.NONE else self.hi[node] - self.lo[node]
+
+    def locate(self, q, limit=None, sort=False):
+        node = self.find_locus(q)
+        if node == self.NONE:
+            return iter(())
+        # A copy, since later expansions reorder the suffixes in place
+        return utils.take_positions([self.suffixes[self.lo[node]:self.hi[node]].copy()], limit, sort)
+
+    def search_tree(self, P):
+        # Length of the longest prefix of P that occurs in the text
+        if self.max_nodes is not None and len(self.start) > self.max_nodes:
+            self.prune()
+        T, start, end = self.s, self.start, self.end
+
+        n = self.ROOT
+        i = 0
+
+        while i < len(P):
+            n = self.get_child(n, P[i])
+            if n == self.NONE:
+                return i
+
+            j = start[n]
+            while i < len(P) and j < end[n] and P[i] == T[j]:
+                i += 1
+                j += 1
+
+            if j < end[n]:
+                return i
+
+        return i
+
+def main():
+    args = get_args()
+
+    T, records = None, None
+
+    if args.string:
+        T = args.string
+    elif args.reference:
+        T, records = record_table.join_records(utils.iter_fasta(args.reference))
+
+    print('Extracted file')
+
+    tree = LazySuffixTree(T, max_nodes=args.max_nodes, records=records)
+
+    print('Tree ready')
+
+    if args.query:
+        for query in args.query:
+            match_len = tree.align(query)
+            print(f'{query} : {match_len}')
+            if args.locate:
+                for record, offset in record_table.locate_records(tree, query, args.locate, sort=True):
+                    print(f'\t{record}:{offset}')
+        print(f'{len(tree.start)} nodes in the tree')
+
+if __name__ == '__main__':
+    main()
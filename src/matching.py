@@ -0,0 +1,99 @@
+import argparse
+import record_table
+import utils
+from suffix_automaton import SuffixAutomaton
+from suffix_tree import SuffixTree
+
+# Maximal exact matches between a read and an indexed text, built on
+# matching statistics: ms[i] is the length of the longest prefix of read[i:]
+# that occurs in the text, as returned in one pass over the read by
+# SuffixTree.matching_statistics or SuffixAutomaton.matching_statistics.
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Maximal exact matches')
+
+    parser.add_argument('--reference',
+                        help='Reference sequence file',
+                        type=str)
+
+    parser.add_argument('--string',
+                        help='Reference sequence',
+                        type=str)
+
+    parser.add_argument('--read',
+                        help='Read sequences',
+                        nargs='+',
+                        type=str)
+
+    parser.add_argument('--min_length',
+                        help='Shortest match to report',
+                        type=int,
+                        default=20)
+
+    parser.add_argument('--automaton',
+                        help='Use a suffix automaton (SMEMs only, no positions)',
+                        action='store_true')
+
+    return parser.parse_args()
+
+def smems(ms, min_length=1):
+    # (read offset, length) of every super-maximal exact match: a substring
+    # of the read that occurs in the text, cannot be extended either way and
+    # lies inside no other such match. The match at i is right-maximal by
+    # definition, and left-maximal unless the match at i - 1 reaches as far.
+    # Match ends never decrease with i, so no left-maximal match can contain
+    # another.
+    return [(i, length) for i, length in enumerate(ms)
+            if length >= min_length and (i == 0 or ms[i - 1] <= length)]
+
+def mems(tree, read, min_length=1, ms=None):
+    # (read offset, text offset, length) of every maximal exact match: a
+    # pair of occurrences in the read and the text of a suffix tree that
+    # cannot be extended left or right together. Each starts with a
+    # min_length match at some read offset, so only offsets with ms[i] >=
+    # min_length are located; a hit whose preceding characters agree belongs
+    # to the MEM starting one character earlier.
+    T = tree.s
+    if ms is None:
+        ms = tree.matching_statistics(read)
+    matches = []
+    for i, longest in enumerate(ms):
+        if longest < min_length:
+            continue
+        for position in tree.locate(read[i:i + min_length], sort=True):
+            if i > 0 and position > 0 and T[position - 1] == read[i - 1]:
+                continue
+            length, limit = min_length, min(longest, len(T) - position)
+            while length < limit and T[position + length] == read[i + length]:
+                length += 1
+            matches.append((i, position, length))
+    return matches
+
+def main():
+    args = get_args()
+
+    T, records = None, None
+
+    if args.string:
+        T = args.string
+    elif args.reference:
+        T, records = record_table.join_records(utils.iter_fasta(args.reference))
+
+    print('Extracted file')
+
+    index = SuffixAutomaton(T) if args.automaton else SuffixTree(T, records=records)
+
+    print('Index built')
+
+    for read in args.read or ():
+        ms = index.matching_statistics(read)
+        print(f'{read} : {len(smems(ms, args.min_length))} SMEMs')
+        for offset, length in smems(ms, args.min_length):
+            print(f'\tSMEM {offset}+{length}')
+        if not args.automaton:
+            for offset, position, length in mems(index, read, args.min_length, ms):
+                record, record_offset = (None, position) if records is None else records.resolve(position)
+                print(f'\tMEM {offset}+{length} {record}:{record_offset}')
+
+if __name__ == '__main__':
+    main()
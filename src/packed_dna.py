@@ -0,0 +1,181 @@
+import numpy as np
+
+BASES = 'ACGT'
+WORD = 32 # Bases compared per step by match_length
+
+# ASCII code -> 2-bit base, or 4 for anything that is not A/C/G/T
+BASE_CODES = np.full(256, 4, dtype=np.uint8)
+for code, base in enumerate(BASES):
+    BASE_CODES[ord(base)] = code
+
+BASE_ASCII = np.frombuffer(BASES.encode('ascii'), dtype=np.uint8)
+
+# Packed byte -> its four bases as ASCII codes, first base in the high bits
+UNPACKED = np.array([[ord(BASES[(byte >> shift) & 3]) for shift in (6, 4, 2, 0)]
+                     for byte in range(256)], dtype=np.uint8)
+
+QUERY_DIGITS = str.maketrans(BASES, '0123')
+
+def is_bases(s):
+    # Whether s is only A/C/G/T: stripping those from both ends leaves
+    # nothing exactly when no other character (a digit, say) is in s
+    return not s.strip(BASES)
+
+class PackedDNA():
+    # Nucleotide text at 2 bits per base. Anything other than A/C/G/T (N and
+    # other ambiguity codes, the '$' sentinel) is packed as A and recorded as
+    # runs [start, end) of one repeated character, found by binary search.
+    SECTIONS = ('packed', 'run_starts', 'run_ends', 'run_codes')
+
+    def __init__(self, text=''):
+        if isinstance(text, str):
+            text = text.encode('latin-1')
+        codes = np.frombuffer(text, dtype=np.uint8) if isinstance(text, (bytes, bytearray)) else text
+        self.length = len(codes)
+
+        bases = BASE_CODES[codes]
+        other = bases == 4
+        bases[other] = 0
+        padded = np.zeros(-(-self.length // 4) * 4, dtype=np.uint8)
+        padded[:self.length] = bases
+        padded = padded.reshape(-1, 4)
+        self.packed = ((padded[:, 0] << 6) | (padded[:, 1] << 4) | (padded[:, 2] << 2) | padded[:, 3]).tobytes()
+
+        positions = np.flatnonzero(other)
+        breaks = np.flatnonzero((np.diff(positions) != 1) | (np.diff(codes[positions]) != 0)) + 1
+        starts = positions[np.concatenate(([0], breaks))] if len(positions) else positions
+        ends = positions[np.concatenate((breaks - 1, [len(positions) - 1]))] + 1 if len(positions) else positions
+        self.run_starts, self.run_ends = starts.astype(np.int64), ends.astype(np.int64)
+        self.run_codes = codes[starts].copy()
+
+    def sections(self):
+        # Arrays the text is saved as; see from_sections
+        return {'length': np.array([self.length], dtype=np.int64),
+                'packed': np.frombuffer(self.packed, dtype=np.uint8),
+                **{name: getattr(self, name) for name in self.SECTIONS[1:]}}
+
+    @classmethod
+    def from_sections(cls, sections):
+        # A packed text over saved (possibly memory-mapped) arrays, read in
+        # place: the packed bytes through a memoryview, like bytes
+        text = cls()
+        text.length = int(sections['length'][0])
+        text.packed = memoryview(sections['packed'])
+        for name in cls.SECTIONS[1:]:
+            setattr(text, name, sections[name])
+        return text
+
+    def run_at(self, i):
+        # Index of the run that covers position i, or -1
+        run = int(self.run_starts.searchsorted(i, 'right')) - 1
+        return run if run >= 0 and self.run_ends[run] > i else -1
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.length)
+            if step != 1:
+                return self.codes()[key].tobytes().decode('latin-1')
+            return self.codes(start, stop).tobytes().decode('latin-1')
+
+        i = key + self.length if key < 0 else key
+        if not 0 <= i < self.length:
+            raise IndexError('PackedDNA index out of range')
+        run = self.run_at(i) if len(self.run_starts) else -1
+        if run >= 0:
+            return chr(self.run_codes[run])
+        return BASES[self.packed[i >> 2] >> (6 - 2 * (i & 3)) & 3]
+
+    def __add__(self, other):
+        if isinstance(other, (str, PackedDNA)):
+            return PackedDNA(np.concatenate((self.codes(), as_codes(other))))
+        return NotImplemented
+
+    def __radd__(self, other):
+        if isinstance(other, str):
+            return PackedDNA(np.concatenate((as_codes(other), self.codes())))
+        return NotImplemented
+
+    def __str__(self):
+        return self[:]
+
+    def __repr__(self):
+        return f'PackedDNA({self.length} bases)'
+
+    def codes(self, start=0, stop=None):
+        # ASCII codes of text[start:stop] as a uint8 array
+        stop = self.length if stop is None else stop
+        if start >= stop:
+            return np.empty(0, dtype=np.uint8)
+        first = start >> 2
+        packed = np.frombuffer(self.packed, dtype=np.uint8, offset=first, count=((stop + 3) >> 2) - first)
+        codes = UNPACKED[packed].reshape(-1)[start - 4 * first:stop - 4 * first].copy()
+
+        first = max(int(np.searchsorted(self.run_starts, start, side='right')) - 1, 0)
+        last = int(np.searchsorted(self.run_starts, stop))
+        for run_start, run_end, code in zip(self.run_starts[first:last].tolist(),
+                                            self.run_ends[first:last].tolist(),
+                                            self.run_codes[first:last].tolist()):
+            lo, hi = max(run_start, start), min(run_end, stop)
+            if lo < hi:
+                codes[lo - start:hi - start] = code
+        return codes
+
+    def take(self, positions):
+        # ASCII codes at an integer array of positions, read straight from
+        # the packed bytes without decoding the rest of the text
+        positions = np.asarray(positions, dtype=np.int64)
+        packed = np.frombuffer(self.packed, dtype=np.uint8)
+        codes = BASE_ASCII[packed[positions >> 2] >> (6 - 2 * (positions & 3)) & 3]
+        if len(self.run_starts):
+            runs = np.searchsorted(self.run_starts, positions, side='right') - 1
+            other = (runs >= 0) & (positions < self.run_ends[np.maximum(runs, 0)])
+            codes[other] = self.run_codes[runs[other]]
+        return codes
+
+    def has_exception(self, start, stop):
+        # Whether a run overlaps [start, stop): the last run starting before
+        # stop ends after start
+        run = int(self.run_starts.searchsorted(stop - 1, 'right')) - 1
+        return run >= 0 and self.run_ends[run] > start
+
+    def word(self, start, width):
+        # Bases text[start:start + width] as one 2-bit-per-base integer
+        first, last = start >> 2, (start + width + 3) >> 2
+        value = int.from_bytes(self.packed[first:last], 'big')
+        return value >> (8 * (last - first) - 2 * (start & 3) - 2 * width) & ((1 << 2 * width) - 1)
+
+    def kmer(self, start, k):
+        # 2-bit code of the k-mer at start, or None if it is not pure A/C/G/T
+        if start + k > self.length or self.has_exception(start, start + k):
+            return None
+        return self.word(start, k)
+
+    def match_length(self, offset, q, k=0):
+        # Extend a k-character match of q against text[offset:], comparing
+        # up to WORD bases per step as packed integers
+        n, m = self.length, len(q)
+        while k < m and offset + k < n:
+            width = min(WORD, m - k, n - offset - k)
+            i = offset + k
+            block = q[k:k + width]
+            if not is_bases(block) or self.has_exception(i, i + width):
+                # Query or text block is not pure A/C/G/T
+                for j in range(width):
+                    if self[i + j] != q[k + j]:
+                        return k + j
+                k += width
+                continue
+
+            diff = self.word(i, width) ^ int(block.translate(QUERY_DIGITS), 4)
+            if diff:
+                return k + (2 * width - diff.bit_length()) // 2
+            k += width
+        return k
+
+def as_codes(text):
+    if isinstance(text, PackedDNA):
+        return text.codes()
+    return np.frombuffer(text.encode('latin-1'), dtype=np.uint8)
@@ -0,0 +1,167 @@
+import multiprocessing as mp
+import os
+from multiprocessing import shared_memory, util
+import numpy as np
+
+MAX_KMER = 16 # Leading characters that put a suffix in its bucket
+TASKS_PER_PROCESS = 4 # Bucket ranges per worker, to even out their sizes
+SAMPLE_SIZE = 1 << 16 # Keys sampled to pick the bucket ranges
+
+# Blocks attached by each worker: the text, the k-mer key of every suffix,
+# the suffix array and two rank buffers (one read, one written per round)
+_worker_arrays, _worker_blocks = None, None
+
+def attach_blocks(layout):
+    global _worker_arrays, _worker_blocks
+    _worker_arrays, _worker_blocks = {}, []
+    for name, (block_name, dtype, shape) in layout.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        _worker_blocks.append(block)
+        _worker_arrays[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    util.Finalize(None, release_blocks, exitpriority=10)
+
+def release_blocks():
+    global _worker_arrays, _worker_blocks
+    _worker_arrays = None
+    for block in _worker_blocks:
+        block.close()
+    _worker_blocks = None
+
+def kmer_keys(task):
+    # Key of every suffix starting in [lo, hi): its first k characters as
+    # digits in the given base, 0 past the end of the text
+    lo, hi, k, alphabet = task
+    codes, keys = _worker_arrays['codes'], _worker_arrays['keys']
+    n = len(codes)
+    window = np.zeros(hi - lo + k - 1, dtype=np.int64)
+    stop = min(hi + k - 1, n)
+    window[:stop - lo] = np.searchsorted(alphabet, codes[lo:stop]) + 1
+    base = len(alphabet) + 1
+    chunk_keys = np.zeros(hi - lo, dtype=np.int64)
+    for j in range(k):
+        chunk_keys = chunk_keys * base + window[j:j + hi - lo]
+    keys[lo:hi] = chunk_keys
+
+def group_ranks(offset, *columns):
+    # Rank of each sorted row: the SA index where its group of equal rows
+    # starts, so that ranks agree across independently sorted chunks
+    boundary = np.empty(len(columns[0]), dtype=bool)
+    boundary[0] = True
+    np.not_equal(columns[0][1:], columns[0][:-1], out=boundary[1:])
+    for column in columns[1:]:
+        boundary[1:] |= column[1:] != column[:-1]
+    starts = np.flatnonzero(boundary)
+    return offset + starts[np.cumsum(boundary) - 1], bool(boundary.all())
+
+def sort_bucket_range(task):
+    # Sort sa[lo:hi], the positions (in text order) of the suffixes in one
+    # range of buckets, by key. Returns whether every bucket in it is one
+    # suffix.
+    lo, hi = task
+    keys = _worker_arrays['keys']
+    positions = _worker_arrays['sa'][lo:hi]
+    if len(positions) == 0:
+        return True
+    positions[:] = positions[np.argsort(keys[positions], kind='stable')]
+    ranks, done = group_ranks(lo, keys[positions])
+    _worker_arrays['rank0'][positions] = ranks
+    _worker_arrays['rank1'][positions] = ranks
+    return done
+
+def refine_range(task):
+    # One prefix doubling round over sa[lo:hi]: suffixes sorted by their
+    # first h characters are sorted by their first 2h
+    lo, hi, h, source = task
+    sa = _worker_arrays['sa'][lo:hi]
+    rank, target = _worker_arrays[f'rank{source}'], _worker_arrays[f'rank{1 - source}']
+    n = len(rank)
+
+    first = rank[sa]
+    after = sa + h
+    second = np.full(len(sa), -1, dtype=np.int64) # Past the end sorts first
+    inside = after < n
+    second[inside] = rank[after[inside]]
+
+    if n < 2**31:
+        order = np.argsort((first - lo) * (n + 1) + (second + 1), kind='stable')
+    else:
+        order = np.lexsort((second, first))
+    sa[:] = sa[order]
+    ranks, done = group_ranks(lo, first[order], second[order])
+    target[sa] = ranks
+    return done
+
+def split_keys(keys, parts):
+    # Key values that cut the sorted keys into about equal ranges; a bucket
+    # is never split, so one large bucket makes one large range
+    sample = np.sort(keys[::max(len(keys) // SAMPLE_SIZE, 1)])
+    cuts = sample[np.linspace(0, len(sample), parts + 1, dtype=np.int64)[1:-1]]
+    return np.unique(cuts)
+
+def sort_shared(pool, arrays, k, alphabet, parts):
+    n = len(arrays['codes'])
+    edges = np.linspace(0, n, parts + 1, dtype=np.int64)
+    pool.map(kmer_keys, [(lo, hi, k, alphabet) for lo, hi in zip(edges[:-1], edges[1:]) if lo < hi])
+
+    # Partition the positions by bucket range once, so that each task only
+    # reads its own slice: a stable sort by range, a radix sort for 16-bit
+    # range numbers, keeps them in text order within a range
+    keys = arrays['keys']
+    cuts = split_keys(keys, parts)
+    part = np.searchsorted(cuts, keys, side='right')
+    part = part.astype(np.uint16 if len(cuts) < 2**16 else np.int64)
+    arrays['sa'][:] = np.argsort(part, kind='stable')
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(part, minlength=len(cuts) + 1))))
+
+    ranges = [(int(offsets[i]), int(offsets[i + 1])) for i in range(len(cuts) + 1)]
+    done = pool.map(sort_bucket_range, ranges)
+    pending = [(lo, hi) for (lo, hi), finished in zip(ranges, done) if not finished and lo < hi]
+    h, source = k, 0
+    while pending:
+        done = pool.map(refine_range, [(lo, hi, h, source) for lo, hi in pending])
+        target = 1 - source
+        for (lo, hi), finished in zip(pending, done):
+            if finished:
+                # Final ranks go into both buffers, since later rounds may
+                # read either
+                rows = arrays['sa'][lo:hi]
+                arrays[f'rank{source}'][rows] = arrays[f'rank{target}'][rows]
+        pending = [bounds for bounds, finished in zip(pending, done) if not finished]
+        h, source = 2 * h, target
+
+    return arrays['sa'].copy()
+
+def bucket_sort_suffixes(codes, processes=None):
+    # Suffix array of codes (int64). Suffixes are bucketed by their first k
+    # characters and the bucket ranges are sorted, then refined by prefix
+    # doubling, independently by a pool of workers over shared memory.
+    # Rounds are synchronised: each one reads one rank buffer and writes
+    # the other, so no worker sees ranks from two different rounds.
+    n = len(codes)
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+    processes = processes or os.cpu_count()
+
+    if codes.dtype == np.uint8:
+        alphabet = np.flatnonzero(np.bincount(codes, minlength=256)).astype(np.uint8)
+    else:
+        alphabet = np.unique(codes)
+    k = int(min(MAX_KMER, max(62 // np.log2(len(alphabet) + 1), 1)))
+
+    blocks, arrays, layout = [], {}, {}
+    try:
+        for name, dtype in (('codes', codes.dtype), ('keys', np.int64), ('sa', np.int64),
+                            ('rank0', np.int64), ('rank1', np.int64)):
+            block = shared_memory.SharedMemory(create=True, size=n * np.dtype(dtype).itemsize)
+            blocks.append(block)
+            arrays[name] = np.ndarray(n, dtype=dtype, buffer=block.buf)
+            layout[name] = (block.name, np.dtype(dtype).str, (n,))
+        arrays['codes'][:] = codes
+
+        with mp.Pool(processes, initializer=attach_blocks, initargs=(layout,)) as pool:
+            return sort_shared(pool, arrays, k, alphabet, processes * TASKS_PER_PROCESS)
+    finally:
+        arrays.clear()
+        for block in blocks:
+            block.close()
+            block.unlink()
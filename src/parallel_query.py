@@ -0,0 +1,225 @@
+import argparse
+import itertools
+import time
+import multiprocessing as mp
+from multiprocessing import shared_memory, util
+import numpy as np
+import index_io
+import record_table
+import utils
+from packed_dna import PackedDNA
+from suffix_array import SuffixArray
+from suffix_tree import SuffixTree
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Parallel queries over one shared index')
+
+    parser.add_argument('--reference',
+                        help='Reference sequence file',
+                        type=str)
+
+    parser.add_argument('--string',
+                        help='Reference sequence',
+                        type=str)
+
+    parser.add_argument('--index_type',
+                        help='Index to build (default: array)',
+                        choices=['array', 'tree'],
+                        default='array')
+
+    parser.add_argument('--index',
+                        help='Query a saved SuffixArray or SuffixTree, memory-mapped by every worker, '
+                             'instead of building one',
+                        type=str)
+
+    parser.add_argument('--query',
+                        help='Query sequences',
+                        nargs='+',
+                        type=str)
+
+    parser.add_argument('--query_file',
+                        help='FASTA file with one query per record',
+                        type=str)
+
+    parser.add_argument('--processes',
+                        help='Worker processes (default: all cores)',
+                        type=int)
+
+    return parser.parse_args()
+
+INDEX_KINDS = {'SuffixArray': 'array', 'SuffixTree': 'tree'} # Saved index kinds the workers can open
+
+def shared_fields(index):
+    # The arrays each index needs to answer queries, as NumPy arrays
+    if isinstance(index, SuffixArray):
+        return {'codes': index.text_array(), 'array': index.array}
+    if isinstance(index, SuffixTree):
+        fields = {'s': index_io.as_numpy(index.s)}
+        for name in ('start', 'end', 'first_child', 'next_sibling'):
+            fields[name] = np.frombuffer(getattr(index, name), dtype=np.int32)
+        return fields
+    raise TypeError(f'Cannot share a {type(index).__name__}')
+
+def attach_index(kind, layout, size):
+    # Rebuild a query-only index over the shared blocks without copying them.
+    # The tree searches memoryviews (ints) and so takes byte-string queries.
+    blocks, views = [], {}
+    for name, (block_name, dtype, shape) in layout.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        if kind == 'array':
+            views[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        else:
+            views[name] = block.buf[:nbytes].cast(np.dtype(dtype).char)
+
+    if kind == 'array':
+        index = SuffixArray()
+        index.codes, index.array = views['codes'], views['array']
+    else:
+        index = SuffixTree()
+        index.s, index.size = views.pop('s'), size
+        for name, view in views.items():
+            setattr(index, name, view)
+    return index, blocks
+
+def open_index(kind, path):
+    # Query-only index over the memory maps of a saved index. Every worker
+    # maps the same file, so the OS shares its pages and nothing is copied.
+    header, sections = index_io.read_index(path, 'SuffixArray' if kind == 'array' else 'SuffixTree')
+    if kind == 'array':
+        index = SuffixArray()
+        text = index_io.read_text(sections)
+        if isinstance(text, PackedDNA):
+            index.T = text
+        else:
+            index.codes = text
+        index.array = sections['array']
+    else:
+        index = SuffixTree()
+        text = index_io.read_text(sections)
+        index.s = text if isinstance(text, PackedDNA) else memoryview(text)
+        for column in SuffixTree.COLUMNS:
+            setattr(index, column, memoryview(sections[column]))
+        for field in SuffixTree.STATE:
+            setattr(index, field, header['scalars'][field])
+    return index
+
+_worker_kind, _worker_index, _worker_blocks = None, None, None
+
+def init_worker(kind, layout, size):
+    global _worker_kind, _worker_index, _worker_blocks
+    _worker_kind = kind
+    _worker_index, _worker_blocks = attach_index(kind, layout, size)
+    util.Finalize(None, release_worker, exitpriority=10)
+
+def open_worker(kind, path):
+    global _worker_kind, _worker_index, _worker_blocks
+    _worker_kind = kind
+    _worker_index, _worker_blocks = open_index(kind, path), []
+    util.Finalize(None, release_worker, exitpriority=10)
+
+def release_worker():
+    # Views into the blocks must be gone before the blocks can be closed
+    global _worker_index, _worker_blocks
+    _worker_index = None
+    for block in _worker_blocks:
+        block.close()
+    _worker_blocks = None
+
+def align_chunk(queries):
+    if _worker_kind == 'array':
+        return _worker_index.align_many(queries)[2].tolist()
+    if isinstance(_worker_index.s, PackedDNA):
+        return [_worker_index.search_tree(query) for query in queries]
+    return [_worker_index.search_tree(query.encode('latin-1')) for query in queries]
+
+class ParallelAligner():
+    CHUNK_SIZE = 4096 # Queries per task sent to a worker
+
+    def __init__(self, index, processes=None, chunk_size=CHUNK_SIZE):
+        # index is a built SuffixArray or SuffixTree, whose arrays are copied
+        # once into shared memory, or the path of a saved one
+        self.chunk_size = chunk_size
+        self.blocks, layout = [], {}
+        if isinstance(index, str):
+            header = index_io.read_header(index)
+            if header['kind'] not in INDEX_KINDS:
+                raise index_io.IndexFormatError(f'{index} holds a {header["kind"]}, not a SuffixArray or SuffixTree')
+            if header['scalars'].get('sparse_step', 1) > 1:
+                raise ValueError('ParallelAligner needs a full suffix array (sparse_step=1)')
+            self.kind = INDEX_KINDS[header['kind']]
+            self.pool = mp.Pool(processes, initializer=open_worker, initargs=(self.kind, index))
+            return
+
+        self.kind = 'array' if isinstance(index, SuffixArray) else 'tree'
+        if self.kind == 'array':
+            index.require_full_array('ParallelAligner')
+
+        for name, values in shared_fields(index).items():
+            block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+            np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[:] = values
+            self.blocks.append(block)
+            layout[name] = (block.name, values.dtype.str, values.shape)
+
+        self.pool = mp.Pool(processes,
+                            initializer=init_worker,
+                            initargs=(self.kind, layout, getattr(index, 'size', 0)))
+
+    def align(self, queries):
+        # Results of index.align for each query, lazily and in input order.
+        # Suffix array results are match counts (0 when there is no match).
+        queries = iter(queries)
+        chunks = iter(lambda: list(itertools.islice(queries, self.chunk_size)), [])
+        for results in self.pool.imap(align_chunk, chunks):
+            yield from results
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def main():
+    args = get_args()
+
+    T = None
+
+    if args.string:
+        T = args.string
+    elif args.reference:
+        T, _ = record_table.join_records(utils.iter_fasta(args.reference))
+
+    if args.index:
+        index = args.index
+        if T is not None:
+            index_io.check_reference(args.index, T)
+    else:
+        index = SuffixArray(T) if args.index_type == 'array' else SuffixTree(T)
+
+    print('Index built')
+
+    queries = list(args.query or [])
+    if args.query_file:
+        queries += [sequence for _, sequence in utils.iter_fasta(args.query_file)]
+
+    with ParallelAligner(index, args.processes) as aligner:
+        start = time.perf_counter()
+        results = list(aligner.align(queries))
+        elapsed = time.perf_counter() - start
+
+    if args.query:
+        for query, result in zip(args.query, results):
+            print(f'{query} : {result}')
+    print(f'{len(queries)} queries in {elapsed:.3f}s ({len(queries) / max(elapsed, 1e-9):.0f} queries/s)')
+
+if __name__ == '__main__':
+    main()
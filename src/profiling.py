@@ -0,0 +1,58 @@
+import time
+from contextlib import contextmanager, nullcontext
+
+COUNTERS = ('nodes_visited', 'char_comparisons', 'probes', 'bytes_sliced')
+NO_PHASE = nullcontext()
+
+class Profile():
+    # Search counters and per-phase build timings of one index. Counters an
+    # index has no use for (probes in a tree, say) stay at zero.
+
+    def __init__(self):
+        self.build_ns = {}
+        self.reset()
+
+    def reset(self):
+        # Clears the search counters; build timings are kept
+        for counter in COUNTERS:
+            setattr(self, counter, 0)
+
+    def as_dict(self):
+        stats = {counter: getattr(self, counter) for counter in COUNTERS}
+        stats.update((f'build_{name}_ns', ns) for name, ns in self.build_ns.items())
+        return stats
+
+@contextmanager
+def timed(profile, name):
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        profile.build_ns[name] = profile.build_ns.get(name, 0) + time.perf_counter_ns() - start
+
+def phase(profile, name):
+    # Times a build phase into profile, or does nothing without one
+    return NO_PHASE if profile is None else timed(profile, name)
+
+class Profiled():
+    # Opt-in instrumentation for an index. enable_profiling() shadows every
+    # method named in PROFILED_METHODS with its counting twin on the
+    # instance, so the plain methods carry no bookkeeping at all.
+    PROFILED_METHODS = {}
+    profile = None
+
+    def enable_profiling(self):
+        self.profile = Profile()
+        for method, profiled in self.PROFILED_METHODS.items():
+            setattr(self, method, getattr(self, profiled))
+
+    def disable_profiling(self):
+        self.profile = None
+        for method in self.PROFILED_METHODS:
+            self.__dict__.pop(method, None)
+
+    def stats(self):
+        return {} if self.profile is None else self.profile.as_dict()
+
+def format_stats(stats):
+    return '\t' + '  '.join(f'{name} {value}' for name, value in stats.items())
@@ -0,0 +1,212 @@
+import argparse
+import time
+from collections import namedtuple
+import numpy as np
+import record_table
+import utils
+from suffix_array import SuffixArray
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Seed-and-extend read mapper')
+
+    parser.add_argument('--reference',
+                        help='Reference sequence file',
+                        type=str,
+                        required=True)
+
+    parser.add_argument('--reads',
+                        help='FASTA or FASTQ file of reads (default: simulate reads)',
+                        type=str)
+
+    parser.add_argument('--num_reads',
+                        help='Reads to simulate (default: 1000)',
+                        type=int,
+                        default=1000)
+
+    parser.add_argument('--read_length',
+                        help='Length of simulated reads (default: 100)',
+                        type=int,
+                        default=100)
+
+    parser.add_argument('--error_rate',
+                        help='Per-base error rate of simulated reads (default: 0.01)',
+                        type=float,
+                        default=0.01)
+
+    parser.add_argument('--seed',
+                        help='Random seed of simulated reads (default: 0)',
+                        type=int,
+                        default=0)
+
+    parser.add_argument('--write_reads',
+                        help='Write the simulated reads to this FASTA/FASTQ file and exit',
+                        type=str)
+
+    parser.add_argument('--seed_length',
+                        help='k-mer seed length (default: 20)',
+                        type=int,
+                        default=20)
+
+    parser.add_argument('--max_edits',
+                        help='Largest edit distance reported (default: 5)',
+                        type=int,
+                        default=5)
+
+    return parser.parse_args()
+
+Mapping = namedtuple('Mapping', ['position', 'strand', 'edit_distance'])
+
+COMPLEMENT = str.maketrans('ACGTacgt', 'TGCAtgca')
+
+def reverse_complement(read):
+    return read.translate(COMPLEMENT)[::-1]
+
+def myers_search(pattern, text):
+    # Myers' bit-parallel edit distance, with pattern matched anywhere in
+    # text. Returns the smallest distance and the text end offset of a best
+    # match (exclusive).
+    m = len(pattern)
+    if m == 0:
+        return 0, 0
+    full, high = (1 << m) - 1, 1 << (m - 1)
+    peq = {}
+    for i, c in enumerate(pattern):
+        peq[c] = peq.get(c, 0) | (1 << i)
+
+    pv, mv, score = full, 0, m
+    best, best_end = m, 0
+    for j, c in enumerate(text):
+        eq = peq.get(c, 0)
+        xv = eq | mv
+        xh = ((((eq & pv) + pv) & full) ^ pv) | eq
+        ph = mv | (~(xh | pv) & full)
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        ph = (ph << 1) & full
+        mh = (mh << 1) & full
+        pv = mh | (~(xv | ph) & full)
+        mv = ph & xv
+        if score < best:
+            best, best_end = score, j + 1
+    return best, best_end
+
+class ReadMapper():
+    SEED_LENGTH = 20
+    SEED_STRIDE = 10 # Read offsets between consecutive seeds
+    MAX_HITS = 64 # Seeds with more hits than this are treated as repeats
+    MAX_EDITS = 5
+    MAX_CANDIDATES = 3 # Diagonal clusters verified per strand
+
+    def __init__(self, index: SuffixArray, seed_length=SEED_LENGTH, seed_stride=SEED_STRIDE,
+                 max_hits=MAX_HITS, max_edits=MAX_EDITS, max_candidates=MAX_CANDIDATES):
+        self.index = index
+        self.seed_length, self.seed_stride = seed_length, seed_stride
+        self.max_hits, self.max_edits = max_hits, max_edits
+        self.max_candidates = max_candidates
+
+    def seed_offsets(self, read):
+        last = len(read) - self.seed_length
+        if last < 0:
+            return []
+        offsets = list(range(0, last + 1, self.seed_stride))
+        if offsets[-1] != last:
+            offsets.append(last)
+        return offsets
+
+    def map(self, read):
+        return self.map_many([read])[0]
+
+    def map_many(self, reads):
+        # Best Mapping per read, or None. Seeds of every read and strand are
+        # looked up in one align_many batch.
+        reads = list(reads)
+        strands = [(read, reverse_complement(read)) for read in reads]
+        seeds, owners = [], []
+        for read_index, pair in enumerate(strands):
+            for strand_index, sequence in enumerate(pair):
+                for offset in self.seed_offsets(sequence):
+                    seeds.append(sequence[offset:offset + self.seed_length])
+                    owners.append((read_index, strand_index, offset))
+
+        lo, hi, counts = self.index.align_many(seeds)
+        diagonals = [([], []) for _ in reads]
+        for (read_index, strand_index, offset), start, count in zip(owners, lo.tolist(), counts.tolist()):
+            if 0 < count <= self.max_hits:
+                hits = self.index.array[start:start + count]
+                diagonals[read_index][strand_index].append(hits.astype(np.int64) - offset)
+
+        mappings = []
+        for pair, read_diagonals in zip(strands, diagonals):
+            best = None
+            for strand, sequence, strand_diagonals in zip('+-', pair, read_diagonals):
+                for diagonal in self.cluster(strand_diagonals):
+                    mapping = self.verify(sequence, diagonal, strand)
+                    if mapping is not None and (best is None or mapping.edit_distance < best.edit_distance):
+                        best = mapping
+            mappings.append(best)
+        return mappings
+
+    def cluster(self, diagonals):
+        # Group seed diagonals that lie within max_edits of each other and
+        # return the median diagonal of the best-supported groups
+        if not diagonals:
+            return []
+        diagonals = np.sort(np.concatenate(diagonals))
+        breaks = np.flatnonzero(np.diff(diagonals) > self.max_edits) + 1
+        groups = np.split(diagonals, breaks)
+        groups.sort(key=len, reverse=True)
+        return [int(group[len(group) // 2]) for group in groups[:self.max_candidates]]
+
+    def verify(self, read, diagonal, strand):
+        # Banded verification: align the read inside a window of max_edits on
+        # either side of its diagonal, then align it backwards from the best
+        # end to find where the match starts
+        T, band = self.index.T, self.max_edits
+        n = len(T) - 1 # Without the sentinel
+        window_start = max(diagonal - band, 0)
+        window = T[window_start:min(diagonal + len(read) + band, n)]
+
+        distance, end = myers_search(read, window)
+        if distance > self.max_edits:
+            return None
+        _, start = myers_search(read[::-1], window[:end][::-1])
+        return Mapping(window_start + end - start, strand, distance)
+
+def main():
+    args = get_args()
+
+    T, records = record_table.join_records(utils.iter_fasta(args.reference))
+
+    if args.reads:
+        batches = [[sequence for _, sequence in utils.iter_reads(args.reads)]]
+    else:
+        batches = utils.sim_reads(T, args.read_length, args.num_reads, args.error_rate, seed=args.seed)
+        if args.write_reads:
+            written = utils.write_reads(args.write_reads, batches)
+            print(f'{written} reads written to {args.write_reads}')
+            return
+
+    index = SuffixArray(T, records=records)
+    print('Index built')
+
+    # Reads are mapped a batch at a time, so simulated ones are never all
+    # held at once
+    mapper = ReadMapper(index, seed_length=args.seed_length, max_edits=args.max_edits)
+    mappings, elapsed = [], 0.0
+    for batch in batches:
+        start = time.perf_counter()
+        mappings.extend(mapper.map_many(batch))
+        elapsed += time.perf_counter() - start
+    reads = len(mappings)
+
+    mapped = [mapping for mapping in mappings if mapping is not None]
+    print(f'Mapped {len(mapped)}/{reads} reads in {elapsed:.3f}s '
+          f'({reads / max(elapsed, 1e-9):.0f} reads/s)')
+    for distance in range(args.max_edits + 1):
+        print(f'\tedit distance {distance}: {sum(m.edit_distance == distance for m in mapped)}')
+
+if __name__ == '__main__':
+    main()
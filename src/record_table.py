@@ -0,0 +1,60 @@
+from bisect import bisect_right
+
+# Joins the records of a multi-sequence reference. Queries never contain it,
+# so no match can span two records.
+SEPARATOR = '|'
+
+class RecordTable():
+    # Name, start offset and length of each record in a concatenated
+    # reference, in reference order
+
+    def __init__(self, names=(), starts=(), lengths=()):
+        self.names, self.starts, self.lengths = list(names), list(starts), list(lengths)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __str__(self):
+        if len(self.names) == 1:
+            return self.names[0]
+        return f'{self.names[0]} and {len(self.names) - 1} more records'
+
+    def resolve(self, position):
+        # (record name, offset in that record) of a concatenated position
+        record = bisect_right(self.starts, position) - 1
+        return self.names[record], position - self.starts[record]
+
+    def resolve_all(self, positions):
+        for position in positions:
+            yield self.resolve(position)
+
+    def scalars(self):
+        return {'record_names': self.names, 'record_starts': self.starts, 'record_lengths': self.lengths}
+
+    @classmethod
+    def from_scalars(cls, scalars):
+        if 'record_names' not in scalars:
+            return None
+        return cls(scalars['record_names'], scalars['record_starts'], scalars['record_lengths'])
+
+def join_records(records):
+    # One text over all (name, sequence) records, separated by SEPARATOR,
+    # and the table that maps its offsets back to the records
+    names, starts, lengths, sequences = [], [], [], []
+    start = 0
+    for name, sequence in records:
+        names.append(name)
+        starts.append(start)
+        lengths.append(len(sequence))
+        sequences.append(sequence)
+        start += len(sequence) + len(SEPARATOR)
+    return SEPARATOR.join(sequences), RecordTable(names, starts, lengths)
+
+def locate_records(index, q, limit=None, sort=False):
+    # (record name, local offset) of each hit of q in an index over joined
+    # records; an index without a record table has one unnamed record
+    positions = index.locate(q, limit, sort)
+    records = getattr(index, 'records', None)
+    if records is None:
+        return ((None, position) for position in positions)
+    return records.resolve_all(positions)
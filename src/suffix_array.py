@@ -1,5 +1,15 @@
 import argparse
+import sys
+import time
+import numpy as np
+import benchmark
+import external_build
+import index_io
+import parallel_build
+import profiling
+import record_table
 import utils
+from packed_dna import BASE_CODES, QUERY_DIGITS, PackedDNA, is_bases
 
 def get_args():
     parser = argparse.ArgumentParser(description='Suffix Tree')
@@ -17,91 +27,625 @@ def get_args():
                         nargs='+',
                         type=str)
 
+    parser.add_argument('--lcp',
+                        help='Build the LCP array to accelerate search',
+                        action='store_true')
+
+    parser.add_argument('--kmer_table',
+                        help='Build a jump table of the SA intervals of all k-mers up to this length ' \
+                             + '(e.g. 10) to start each search inside its bucket',
+                        type=int)
+
+    parser.add_argument('--sparse',
+                        help='Index only every this many-th suffix (default: 1, every suffix)',
+                        type=int,
+                        default=1)
+
+    parser.add_argument('--memory_budget',
+                        help='Sort the suffix array on disk, straight into --build_index, ' \
+                             + 'within this many megabytes of working memory',
+                        type=float)
+
+    parser.add_argument('--processes',
+                        help='Build the suffix array with this many worker processes',
+                        type=int)
+
+    parser.add_argument('--packed',
+                        help='Hold the reference as 2-bit packed DNA',
+                        action='store_true')
+
+    parser.add_argument('--index',
+                        help='Load a saved index instead of building one',
+                        type=str)
+
+    parser.add_argument('--build_index', '--build-index',
+                        help='Save the built index to this file',
+                        type=str)
+
+    parser.add_argument('--locate',
+                        help='Print up to this many hits of each query as record:offset',
+                        type=int)
+
+    parser.add_argument('--profile',
+                        help='Count search work and time build phases',
+                        action='store_true')
+
     return parser.parse_args()
 
-class SuffixArray():
+def text_codes(T):
+    # Code points of T as an integer array, so suffix order matches str order
+    if isinstance(T, PackedDNA):
+        return T.codes()
+    if T.isascii():
+        return np.frombuffer(T.encode('ascii'), dtype=np.uint8)
+    return np.fromiter(map(ord, T), dtype=np.uint32, count=len(T))
+
+def query_matrix(queries):
+    # Queries as rows of a padded code matrix, plus their lengths
+    lengths = np.fromiter(map(len, queries), dtype=np.int64, count=len(queries))
+    width = max(int(lengths.max(initial=0)), 1) # Keep a column to compare
+    matrix = np.zeros((len(queries), width), dtype=np.int32)
+    starts = np.cumsum(lengths) - lengths
+    rows = np.repeat(np.arange(len(queries)), lengths)
+    cols = np.arange(int(lengths.sum())) - np.repeat(starts, lengths)
+    matrix[rows, cols] = text_codes(''.join(queries))
+    return matrix, lengths
+
+def index_dtype(n):
+    return np.int32 if n < 2**31 else np.int64
+
+def prefix_doubling(codes):
+    # Manber-Myers prefix doubling: after round k every suffix is ranked by
+    # its first 2k characters, so O(log n) rounds of one sort each.
+    n = len(codes)
+    if n == 0:
+        return np.empty(0, dtype=index_dtype(0))
+
+    rank = np.unique(codes, return_inverse=True)[1].astype(np.int64)
+    second = np.empty(n, dtype=np.int64)
+    boundary = np.empty(n, dtype=bool)
+    boundary[0] = True
+    fused = n < 2**31
+    k = 1
+    while True:
+        # Suffixes that run off the end rank below everything, like str '<'
+        second[:n - k] = rank[k:] if k < n else rank[:0]
+        second[max(n - k, 0):] = -1
+
+        if fused:
+            sa = np.argsort(rank * (n + 1) + (second + 1), kind='stable')
+        else:
+            sa = np.lexsort((second, rank))
+
+        ranked, seconds = rank[sa], second[sa]
+        np.not_equal(ranked[1:], ranked[:-1], out=boundary[1:])
+        boundary[1:] |= seconds[1:] != seconds[:-1]
+        rank[sa] = np.cumsum(boundary) - 1
+
+        if rank[sa[-1]] == n - 1 or k >= n:
+            return sa.astype(index_dtype(n))
+        k *= 2
+
+def sparse_suffix_sort(codes, step, processes=None):
+    # Sorted offsets of the suffixes that start at multiples of step. They
+    # are the suffixes of the text read as blocks of step characters (the
+    # last one padded with a code below every character), so the blocks are
+    # ranked and their string is sorted in place of the text.
+    blocks = -(-len(codes) // step)
+    if codes.dtype == np.uint8:
+        alphabet = np.flatnonzero(np.bincount(codes, minlength=256))
+    else:
+        alphabet = np.unique(codes)
+    digits = np.zeros(blocks * step, dtype=np.int64)
+    digits[:len(codes)] = np.searchsorted(alphabet, codes) + 1
+    digits = digits.reshape(blocks, step)
+
+    base = len(alphabet) + 1
+    if step * np.log2(base) < 62:
+        block_codes = np.zeros(blocks, dtype=np.int64)
+        for column in digits.T:
+            block_codes = block_codes * base + column
+    else:
+        # Blocks too wide for one integer are ranked row by row
+        block_codes = np.unique(digits, axis=0, return_inverse=True)[1].reshape(-1)
+
+    if processes is not None and processes > 1:
+        order = parallel_build.bucket_sort_suffixes(block_codes, processes)
+    else:
+        order = prefix_doubling(block_codes)
+    return order.astype(np.int64) * step
+
+def kasai_lcp(T, array):
+    # lcp[i] = LCP(T[array[i-1]:], T[array[i]:]), computed in text order via
+    # the phi array (Karkkainen et al.), so h drops by at most one per step
+    n = len(array)
+    phi = np.empty(n, dtype=array.dtype)
+    phi[array[0]] = -1
+    phi[array[1:]] = array[:-1]
+
+    plcp = np.empty(n, dtype=array.dtype)
+    h, block = 0, 1 << 20
+    for block_start in range(0, n, block):
+        prevs = phi[block_start:block_start + block].tolist()
+        heights = []
+        for i, j in enumerate(prevs, block_start):
+            if j < 0:
+                h = 0
+            else:
+                while i + h < n and j + h < n and T[i + h] == T[j + h]:
+                    h += 1
+            heights.append(h)
+            if h > 0:
+                h -= 1
+        plcp[block_start:block_start + len(heights)] = heights
+    return plcp[array]
+
+def kmer_slot(depth):
+    # First slot of the level for depth-mers in a jump table; levels for
+    # every length 0..k are stored one after another
+    return ((1 << 2 * depth) - 1) // 3
+
+def kmer_table(codes, array, k):
+    # SA interval [lo, hi) of every A/C/G/T string of length 0..k. The rows
+    # whose suffix starts with j pure bases are sorted by those bases, which
+    # order like their 2-bit codes, so each level is two searchsorted calls.
+    bases = BASE_CODES[np.minimum(codes, 255)]
+    n = len(bases)
+    kmers = np.zeros(n, dtype=np.uint32)
+    depths = np.zeros(n, dtype=np.uint8) # Leading pure bases, up to k
+    pure = np.ones(n, dtype=bool)
+    for i in range(k):
+        shifted = np.full(n, 4, dtype=np.uint8)
+        shifted[:n - i] = bases[i:]
+        pure &= shifted < 4
+        depths += pure
+        kmers = (kmers << 2) | (shifted & 3)
+    kmers, depths = kmers[array], depths[array]
+
+    dtype = index_dtype(n + 1)
+    lo = np.empty(kmer_slot(k + 1), dtype=dtype)
+    hi = np.empty(kmer_slot(k + 1), dtype=dtype)
+    for depth in range(k + 1):
+        rows = np.flatnonzero(depths >= depth)
+        prefixes = kmers[rows] >> 2 * (k - depth)
+        slots = np.arange(1 << 2 * depth, dtype=np.uint32)
+        first = np.searchsorted(prefixes, slots)
+        last = np.searchsorted(prefixes, slots, side='right')
+        rows = np.append(rows, n)
+        level = slice(kmer_slot(depth), kmer_slot(depth + 1))
+        lo[level] = rows[first]
+        hi[level] = np.where(last > first, rows[last - 1] + 1, rows[first])
+    return lo, hi
+
+def search_tree_lcp(lcp):
+    # LCP of each binary-search midpoint with the lo/hi ends of its interval,
+    # for the fixed search tree that starts at (-1, len(lcp)). One level of
+    # the tree at a time; the sentinel ends (-1, n) have LCP 0 with everything.
+    n = len(lcp)
+    padded = np.zeros(n + 2, dtype=lcp.dtype)
+    padded[:n] = lcp
+    llcp = np.zeros(n, dtype=lcp.dtype)
+    rlcp = np.zeros(n, dtype=lcp.dtype)
+
+    lo = np.array([-1], dtype=np.int64)
+    hi = np.array([n], dtype=np.int64)
+    while len(lo):
+        mid = (lo + hi) // 2
+        # Intervals at one level are disjoint and sorted, so their bounds are
+        # nondecreasing; every third reduceat segment spans a gap and is unused
+        bounds = np.empty(3 * len(lo), dtype=np.int64)
+        bounds[0::3], bounds[1::3], bounds[2::3] = lo + 1, mid + 1, hi + 1
+        mins = np.minimum.reduceat(padded, bounds)
+        llcp[mid], rlcp[mid] = mins[0::3], mins[1::3]
+
+        lo, hi = np.concatenate((lo, mid)), np.concatenate((mid, hi))
+        wide = hi - lo > 1
+        order = np.argsort(lo[wide], kind='stable')
+        lo, hi = lo[wide][order], hi[wide][order]
+    return llcp, rlcp
+
+class SuffixArray(profiling.Profiled):
     __algorithm_name__ = 'Suffix array'
+    BATCH_SIZE = 1 << 14 # Queries resolved together by align_many
+    COMPARE_CHUNK = 8 # Characters compared per vectorized step
+    SCAN_BLOCK = 1 << 20 # Text scanned at a time for queries shorter than sparse_step
+    PROFILED_METHODS = {'compare_suffix': 'profiled_compare_suffix'}
 
-    def __init__(self, T: str = None):
-        self.T, self.array = None, None
+    def __init__(self, T: str = None, lcp=False, kmer_length=None, profile=False, records=None,
+                 processes=None, sparse_step=1):
+        self.T, self.codes, self.array = None, None, None
+        self.sparse_step = sparse_step # Only suffixes at multiples of it are indexed
+        self.records = records # RecordTable when T joins several records
+        self.lcp, self.llcp, self.rlcp = None, None, None
+        self.kmer_length, self.kmer_lo, self.kmer_hi = None, None, None
+        if profile:
+            self.enable_profiling()
         if T is not None:
-            self.setup(T)
+            self.setup(T, lcp, kmer_length, processes, sparse_step)
     
-    def setup(self, T):
-        self.T = T
-        self.array = self.build_suffix_array()
+    def setup(self, T, lcp=False, kmer_length=None, processes=None, sparse_step=1):
+        if lcp and sparse_step > 1:
+            raise ValueError('LCP tables need a full suffix array (sparse_step=1)')
+        self.T, self.sparse_step = T, sparse_step
+        with profiling.phase(self.profile, 'suffix_array'):
+            self.array = self.build_suffix_array(processes)
+        if lcp:
+            self.build_lcp_array()
+        if kmer_length:
+            self.build_kmer_table(kmer_length)
 
     def align(self, query):
-        return len(self.search_array(query))
+        return self.count(query)
+
+    def count(self, q):
+        if not q:
+            return len(self.T) - 1 # Every position but the '$' sentinel
+        if self.sparse_step > 1:
+            return sum(len(block) for block in self.sparse_positions(q))
+        return self.search_bound(q, upper=True) - self.search_bound(q)
+
+    def locate(self, q, limit=None, sort=False):
+        # Reference offsets of q, read lazily from its SA interval
+        if not q:
+            return utils.take_positions([np.arange(len(self.T) - 1)], limit, sort)
+        if self.sparse_step > 1:
+            return utils.take_positions(self.sparse_positions(q), limit, sort)
+        lo, hi = self.search_bound(q), self.search_bound(q, upper=True)
+        if limit is not None and not sort:
+            hi = min(hi, lo + limit)
+        blocks = (self.array[start:min(start + utils.POSITION_BLOCK, hi)]
+                  for start in range(lo, hi, utils.POSITION_BLOCK))
+        return utils.take_positions(blocks, limit, sort)
+
+    def align_many(self, queries, batch_size=BATCH_SIZE):
+        # SA intervals [lo, hi) and match counts for every query, in input
+        # order. Queries are sorted so neighbouring rows probe nearby suffixes.
+        self.require_full_array('align_many')
+        queries = list(queries)
+        order = np.array(sorted(range(len(queries)), key=queries.__getitem__), dtype=np.int64)
+        lo = np.empty(len(queries), dtype=np.int64)
+        hi = np.empty(len(queries), dtype=np.int64)
 
-    def build_suffix_array(self):
+        for batch_start in range(0, len(queries), batch_size):
+            batch = order[batch_start:batch_start + batch_size]
+            matrix, lengths = query_matrix([queries[i] for i in batch])
+            lo[batch] = self.search_bounds_many(matrix, lengths)
+            hi[batch] = self.search_bounds_many(matrix, lengths, upper=True)
+
+        # The empty query's interval is every row, but like count() it does
+        # not occur at the '$' sentinel
+        empty = np.fromiter((not query for query in queries), dtype=bool, count=len(queries))
+        return lo, hi, hi - lo - empty
+
+    def build_suffix_array(self, processes=None):
+        # processes > 1 sorts buckets of suffixes in a worker pool instead;
+        # the array is the same either way
         self.T += '$'
-        return sorted((rot for rot in range(len(self.T))), key=lambda rot: self.T[rot:])
+        codes = text_codes(self.T)
+        # A packed text is never decoded whole again; see text_at
+        self.codes = None if isinstance(self.T, PackedDNA) else codes
+        if self.sparse_step > 1:
+            return sparse_suffix_sort(codes, self.sparse_step, processes).astype(index_dtype(len(codes)))
+        if processes is not None and processes > 1:
+            return parallel_build.bucket_sort_suffixes(codes, processes).astype(index_dtype(len(codes)))
+        return prefix_doubling(codes)
 
-    def sa_index_matches_query(self, q, i):
-            offset = self.array[i]
-            if len(self.T) - offset < len(q):
-                return False
-            return self.T[offset:offset+len(q)] == q
+    def require_full_array(self, method):
+        # SA intervals of a sparse array hold only the sampled occurrences
+        if self.sparse_step > 1:
+            raise ValueError(f'{method} needs a full suffix array (sparse_step=1)')
 
-    def search_array(self, q):
-        def boundary_binary_search(border_match_condition, boundary_min = 0, decreasing_mode=True):
-            boundary_max = len(self.array)
-            boundary_mid = int((boundary_max + boundary_min) / 2)
-            while (boundary_max - boundary_min > 1):
-                if self.sa_index_matches_query(q, boundary_mid):
-                    if border_match_condition(boundary_mid):
-                        break # boundary found
-                    else:
-                        if decreasing_mode:
-                            boundary_max = boundary_mid
-                        else:
-                            boundary_min = boundary_mid
-                else:
-                    if self.T[self.array[boundary_mid]:] < q:
-                        boundary_min = boundary_mid
-                    else:
-                        boundary_max = boundary_mid
-                boundary_mid = int((boundary_max + boundary_min) / 2)
-            
-            if self.sa_index_matches_query(q, boundary_mid) and border_match_condition(boundary_mid):
-                return boundary_mid
+    def sparse_positions(self, q):
+        # Offsets of q in blocks, with a sparse array. Each occurrence p has
+        # exactly one j < sparse_step with p + j sampled, so q[j:] is looked up
+        # for every j and its hits are checked against the j characters
+        # before them. A query shorter than sparse_step is matched against
+        # the text directly.
+        step, n = self.sparse_step, self.text_length()
+        query = text_codes(q)
+        m = len(query)
+        if m < step:
+            if m == 0:
+                yield np.arange(n - 1) # Not the '$' sentinel
+                return
+            for start in range(0, n - m + 1, self.SCAN_BLOCK):
+                stop = min(start + self.SCAN_BLOCK, n - m + 1)
+                window = self.text_slice(start, stop + m - 1)
+                starts = np.flatnonzero(window[:stop - start] == query[0])
+                for t in range(1, m):
+                    starts = starts[window[starts + t] == query[t]]
+                if len(starts):
+                    yield starts + start
+            return
+
+        for j in range(step):
+            lo, hi = self.search_bound(q[j:]), self.search_bound(q[j:], upper=True)
+            starts = self.array[lo:hi].astype(np.int64) - j
+            starts = starts[starts >= 0]
+            for t in range(j):
+                starts = starts[self.text_at(starts + t) == query[t]]
+            if len(starts):
+                yield starts
+
+    def text_array(self):
+        return self.codes if self.codes is not None else text_codes(self.T)
+
+    def text_length(self):
+        # Length of the text with its '$', also for an index that holds only
+        # the codes (as the parallel query workers do)
+        return len(self.codes) if self.codes is not None else len(self.T)
+
+    def text_at(self, positions):
+        # Codes of the text at an array of positions; a packed text is read
+        # in place rather than decoded whole
+        return self.codes[positions] if self.codes is not None else self.T.take(positions)
+
+    def text_slice(self, start, stop):
+        return self.codes[start:stop] if self.codes is not None else self.T.codes(start, stop)
+
+    def build_lcp_array(self):
+        with profiling.phase(self.profile, 'lcp'):
+            self.lcp = kasai_lcp(self.T, self.array)
+        with profiling.phase(self.profile, 'lcp_tables'):
+            self.llcp, self.rlcp = search_tree_lcp(self.lcp)
+
+    def build_kmer_table(self, k):
+        with profiling.phase(self.profile, 'kmer_table'):
+            self.kmer_lo, self.kmer_hi = kmer_table(self.text_array(), self.array, k)
+        self.kmer_length = k
+
+    def index_sections(self):
+        sections = {**index_io.text_sections(self.T if self.codes is None else self.codes), 'array': self.array}
+        if self.lcp is not None:
+            sections.update(lcp=self.lcp, llcp=self.llcp, rlcp=self.rlcp)
+        if self.kmer_length is not None:
+            sections.update(kmer_lo=self.kmer_lo, kmer_hi=self.kmer_hi)
+        return sections
+
+    def save(self, path):
+        index_io.write_index(path, type(self).__name__,
+                             index_io.reference_checksum(self.T[:-1]), self.index_sections(),
+                             {'kmer_length': self.kmer_length,
+                              'sparse_step': self.sparse_step,
+                              **(self.records.scalars() if self.records is not None else {})})
+
+    @classmethod
+    def load(cls, path):
+        # Arrays stay memory-mapped; only a plain text is decoded up front,
+        # a packed one is read in place
+        header, sections = index_io.read_index(path, cls.__name__)
+        index = cls()
+        index.array = sections['array']
+        index.records = record_table.RecordTable.from_scalars(header['scalars'])
+        index.sparse_step = header['scalars'].get('sparse_step', 1)
+        text = index_io.read_text(sections)
+        if isinstance(text, PackedDNA):
+            index.T = text
+        elif text.dtype == np.uint8:
+            index.codes, index.T = text, text.tobytes().decode('ascii')
+        else:
+            index.codes, index.T = text, ''.join(map(chr, text.tolist()))
+        if 'lcp' in sections:
+            index.lcp, index.llcp, index.rlcp = sections['lcp'], sections['llcp'], sections['rlcp']
+        if 'kmer_lo' in sections:
+            index.kmer_length = header['scalars']['kmer_length']
+            index.kmer_lo, index.kmer_hi = sections['kmer_lo'], sections['kmer_hi']
+        return index
+
+    @classmethod
+    def build_external(cls, T, path, memory_budget, records=None, scratch_dir=None):
+        # Build the index file at path with the suffix array sorted on disk
+        # in about memory_budget bytes of working memory (the text itself is
+        # held as given), then load it
+        codes = text_codes(T + '$')
+        dtype = index_dtype(len(codes))
+        scalars = {'kmer_length': None, 'sparse_step': 1,
+                   **(records.scalars() if records is not None else {})}
+        index_io.write_index(path, cls.__name__, index_io.reference_checksum(T),
+                             {'text': codes, 'array': index_io.Reserved(dtype, (len(codes),))}, scalars)
+        external_build.sort_suffixes_external(lambda start, stop: codes[start:stop], len(codes),
+                                              path, index_io.section_offset(path, 'array'), dtype,
+                                              memory_budget, scratch_dir)
+        return cls.load(path)
+
+    def compare_suffix(self, q, offset, k):
+        # Extend a k-character match of q against the suffix at offset.
+        # Returns the new match length and whether the suffix sorts below q.
+        T, n, m = self.T, len(self.T), len(q)
+        if isinstance(T, PackedDNA):
+            # match_length stops exactly at the first mismatch, so only that
+            # character is read back
+            k = T.match_length(offset, q, k)
+            if k == m:
+                return k, False
+            return k, offset + k == n or T[offset + k] < q[k]
+        while k < m and offset + k < n and T[offset + k] == q[k]:
+            k += 1
+        if k == m:
+            return k, False
+        return k, offset + k == n or T[offset + k] < q[k]
+
+    def profiled_compare_suffix(self, q, offset, k):
+        # compare_suffix plus its counters: each call is one binary-search
+        # probe of the text; a packed text is read in slices of packed bytes
+        matched, below = SuffixArray.compare_suffix(self, q, offset, k)
+        profile = self.profile
+        compared = matched - k + (matched < len(q) and offset + matched < len(self.T))
+        profile.probes += 1
+        profile.char_comparisons += compared
+        if compared and isinstance(self.T, PackedDNA):
+            profile.bytes_sliced += ((offset + k + compared + 3) >> 2) - ((offset + k) >> 2)
+        return matched, below
+
+    def kmer_bucket(self, q):
+        # Rows [lo, hi) whose suffixes start with the first depth characters
+        # of q, from the jump table, and depth. None without a table or when
+        # that prefix of q is not pure A/C/G/T.
+        if self.kmer_length is None:
+            return None
+        depth = min(len(q), self.kmer_length)
+        if depth == 0 or not is_bases(q[:depth]):
+            return None
+        slot = kmer_slot(depth) + int(q[:depth].translate(QUERY_DIGITS), 4)
+        return int(self.kmer_lo[slot]), int(self.kmer_hi[slot]), depth
+
+    def search_bound(self, q, upper=False):
+        # First SA index whose suffix is >= q (or > q when upper), comparing
+        # only the first len(q) characters. l and r are the match lengths of q
+        # against the suffixes at lo and hi; with the LCP tables no character
+        # of q is compared twice, without them we still skip min(l, r).
+        array, llcp, rlcp = self.array, self.llcp, self.rlcp
+        m = len(q)
+        lo, hi = -1, len(array)
+        l = r = 0
+
+        bucket = self.kmer_bucket(q)
+        if bucket is not None:
+            first, last, depth = bucket
+            if depth == m or first == last:
+                return last if upper else first
+            # Every suffix in the bucket shares depth characters with q. The
+            # LCP tables describe the search tree over the whole array, so
+            # inside a bucket only the mlr skip applies.
+            lo, hi = first - 1, last
+            l = r = depth
+            llcp = rlcp = None
+
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if llcp is None:
+                k = min(l, r)
+            elif l >= r:
+                skip = int(llcp[mid])
+                if skip > l:
+                    lo = mid
+                    continue
+                if skip < l:
+                    hi, r = mid, skip
+                    continue
+                k = l
             else:
-                return None # No match
-        
-        # lo boundary search
-        lo_border_match_condition = lambda mid: mid - 1 < 0 or not self.sa_index_matches_query(q, mid - 1)
-        lo = boundary_binary_search(lo_border_match_condition, boundary_min=0, decreasing_mode=True)
-        
-        if lo is None:
-            return None # No match
+                skip = int(rlcp[mid])
+                if skip > r:
+                    hi = mid
+                    continue
+                if skip < r:
+                    lo, l = mid, skip
+                    continue
+                k = r
+
+            k, below = self.compare_suffix(q, int(array[mid]), k)
+            if below or (upper and k == m):
+                lo, l = mid, k
+            else:
+                hi, r = mid, k
+        return hi
+
+    def compare_suffixes_many(self, matrix, lengths, rows, offsets, k):
+        # compare_suffix for many (query row, suffix offset) pairs at once,
+        # a chunk of characters at a time so that rows which mismatch early
+        # drop out. Returns the new match lengths and which suffixes are below.
+        chunk = np.arange(self.COMPARE_CHUNK)
+        n = self.text_length()
+        k = k.copy()
+        below = np.zeros(len(rows), dtype=bool)
+        pending = np.arange(len(rows))
+
+        while len(pending):
+            positions = k[pending][:, None] + chunk
+            in_query = positions < lengths[rows[pending]][:, None]
+            text_positions = offsets[pending][:, None] + positions
+            window = self.text_at(np.minimum(text_positions, n - 1)).astype(np.int32)
+            window[text_positions >= n] = -1 # Past the end sorts first
+            query = matrix[rows[pending][:, None], np.minimum(positions, matrix.shape[1] - 1)]
+
+            differs = (window != query) & in_query
+            first = differs.argmax(axis=1)
+            picked = np.arange(len(pending))
+            mismatch = differs[picked, first]
 
-        # hi binary search
-        hi_border_match_condition = lambda mid: mid + 1 >= len(self.T) or not self.sa_index_matches_query(q, mid + 1)
-        hi = boundary_binary_search(hi_border_match_condition, boundary_min=lo, decreasing_mode=False)
+            k[pending] = np.where(mismatch, positions[picked, first], positions[:, -1] + 1)
+            below[pending[mismatch]] = window[picked, first][mismatch] < query[picked, first][mismatch]
+            done = mismatch | ~in_query[:, -1]
+            k[pending[done]] = np.minimum(k[pending[done]], lengths[rows[pending[done]]])
+            pending = pending[~done]
 
-        if hi is None:
-            return None # No match, but this should never happen since lo should catch first
-        
-        return range(lo, hi + 1)
+        return k, below
+
+    def search_bounds_many(self, matrix, lengths, upper=False):
+        # search_bound for every row of a query matrix, as one lock-step
+        # binary search that keeps each row's l and r match lengths
+        array = self.array
+        rows = len(matrix)
+        lo = np.full(rows, -1, dtype=np.int64)
+        hi = np.full(rows, len(array), dtype=np.int64)
+        l = np.zeros(rows, dtype=np.int64)
+        r = np.zeros(rows, dtype=np.int64)
+
+        while True:
+            active = np.flatnonzero(hi - lo > 1)
+            if len(active) == 0:
+                return hi
+            mid = (lo[active] + hi[active]) // 2
+
+            k, below = self.compare_suffixes_many(
+                matrix, lengths, active, array[mid].astype(np.int64),
+                np.minimum(l[active], r[active]))
+
+            right = below | (k == lengths[active]) if upper else below
+            lo[active[right]], l[active[right]] = mid[right], k[right]
+            hi[active[~right]], r[active[~right]] = mid[~right], k[~right]
+
+    def search_array(self, q):
+        self.require_full_array('search_array')
+        lo = self.search_bound(q)
+        hi = self.search_bound(q, upper=True)
+        if hi == lo:
+            return None # No match
+        return range(lo, hi)
 
 def main():
     args = get_args()
 
-    T = None
+    T, records = None, None
 
     if args.string:
         T = args.string
     elif args.reference:
-        reference = utils.read_fasta(args.reference)
-        T = reference[0][1]
+        T, records = record_table.join_records(utils.iter_fasta(args.reference))
 
-    array = SuffixArray(T)
+    if args.index:
+        array = SuffixArray.load(args.index)
+        if args.profile:
+            array.enable_profiling()
+        if T is not None:
+            index_io.check_reference(args.index, T)
+    elif args.memory_budget:
+        if not args.build_index or args.lcp or args.kmer_table or args.sparse > 1:
+            sys.exit('suffix_array.py: --memory_budget needs --build_index and builds a plain suffix array')
+        start = time.perf_counter()
+        array = SuffixArray.build_external(T, args.build_index, int(args.memory_budget * 2**20), records=records)
+        print(f'Built {args.build_index} in {time.perf_counter() - start:.1f}s, '
+              f'peak RSS {benchmark.peak_rss() / 2**20:.0f} MB')
+    else:
+        if args.packed:
+            T = PackedDNA(T)
+        array = SuffixArray(T, lcp=args.lcp, kmer_length=args.kmer_table, profile=args.profile,
+                            records=records, processes=args.processes, sparse_step=args.sparse)
+        if args.build_index:
+            array.save(args.build_index)
 
     if args.query:
         for query in args.query:
+            if args.profile:
+                array.profile.reset()
             match_len = array.align(query)
             print(f'{query} : {match_len}')
+            if args.locate:
+                for record, offset in record_table.locate_records(array, query, args.locate, sort=True):
+                    print(f'\t{record}:{offset}')
+            if args.profile:
+                print(profiling.format_stats(array.stats()))
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,242 @@
+import argparse
+from array import array
+import record_table
+import utils
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Suffix automaton')
+
+    parser.add_argument('--reference',
+                        help='Reference sequence file',
+                        type=str)
+
+    parser.add_argument('--string',
+                        help='Reference sequence',
+                        type=str)
+
+    parser.add_argument('--query',
+                        help='Query sequences',
+                        nargs='+',
+                        type=str)
+
+    parser.add_argument('--locate',
+                        help='Print up to this many hits of each query as record:offset',
+                        type=int)
+
+    return parser.parse_args()
+
+class SuffixAutomaton():
+    __algorithm_name__ = 'Suffix automaton'
+    ROOT = 0
+    NONE = -1
+    NODE_TYPE = 'i'
+
+    def __init__(self, s: str = None, records=None):
+        self.occurrences, self.link_children = None, None
+        self.records = records # RecordTable when s joins several records
+        if s is not None:
+            self.setup(s)
+
+    def setup(self, s):
+        self.build_suffix_automaton(s)
+
+    def align(self, query):
+        return self.search_automaton(query)
+
+    def build_suffix_automaton(self, s):
+        # States are rows of parallel arrays: length of the longest string in
+        # the state, suffix link, first outgoing transition, the end offset
+        # of its first occurrence and whether the state is a clone.
+        # Transitions form per-state linked lists of (byte, target, next) rows.
+        self.length, self.link, self.first_edge, self.first_end = (array(self.NODE_TYPE) for _ in range(4))
+        self.cloned = bytearray()
+        self.edge_char = bytearray()
+        self.edge_target, self.edge_next = array(self.NODE_TYPE), array(self.NODE_TYPE)
+        self.last = self.new_state(0, self.NONE, -1)
+        self.extend(s)
+
+    def new_state(self, length, link, first_end, cloned=False):
+        self.length.append(length)
+        self.link.append(link)
+        self.first_edge.append(self.NONE)
+        self.first_end.append(first_end)
+        self.cloned.append(cloned)
+        return len(self.length) - 1
+
+    def get_edge(self, state, c):
+        edge = self.first_edge[state]
+        while edge != self.NONE and self.edge_char[edge] != c:
+            edge = self.edge_next[edge]
+        return edge
+
+    def add_edge(self, state, c, target):
+        self.edge_char.append(c)
+        self.edge_target.append(target)
+        self.edge_next.append(self.first_edge[state])
+        self.first_edge[state] = len(self.edge_char) - 1
+
+    def extend(self, chars):
+        # Online construction, one character at a time (Blumer et al.)
+        self.occurrences, self.link_children = None, None
+        for c in chars:
+            self.add_char(ord(c))
+
+    def add_char(self, c):
+        length, link = self.length, self.link
+        current = self.new_state(length[self.last] + 1, self.NONE, length[self.last])
+
+        state = self.last
+        while state != self.NONE and self.get_edge(state, c) == self.NONE:
+            self.add_edge(state, c, current)
+            state = link[state]
+
+        if state == self.NONE:
+            link[current] = self.ROOT
+        else:
+            target = self.edge_target[self.get_edge(state, c)]
+            if length[state] + 1 == length[target]:
+                link[current] = target
+            else:
+                clone = self.new_state(length[state] + 1, link[target], self.first_end[target], cloned=True)
+                edge = self.first_edge[target]
+                while edge != self.NONE:
+                    self.add_edge(clone, self.edge_char[edge], self.edge_target[edge])
+                    edge = self.edge_next[edge]
+
+                while state != self.NONE:
+                    edge = self.get_edge(state, c)
+                    if edge == self.NONE or self.edge_target[edge] != target:
+                        break
+                    self.edge_target[edge] = clone
+                    state = link[state]
+                link[target] = link[current] = clone
+
+        self.last = current
+
+    def walk(self, q):
+        # State reached by reading the longest readable prefix of q, and its
+        # length
+        state = self.ROOT
+        for i, c in enumerate(q):
+            edge = self.get_edge(state, ord(c))
+            if edge == self.NONE:
+                return state, i
+            state = self.edge_target[edge]
+        return state, len(q)
+
+    def matching_statistics(self, read):
+        # ms[i] = length of the longest prefix of read[i:] that occurs in the
+        # text. One pass over the read finds, for every end j, the longest
+        # match ending there, dropping characters from its start by following
+        # suffix (failure) links. Match starts never decrease with j, so a
+        # second pointer turns them into match lengths by start.
+        length, link = self.length, self.link
+        m = len(read)
+        starts = array(self.NODE_TYPE, bytes(4 * m))
+        state, matched = self.ROOT, 0
+        for j, c in enumerate(read):
+            c = ord(c)
+            while state != self.ROOT and self.get_edge(state, c) == self.NONE:
+                state = link[state]
+                matched = length[state]
+            edge = self.get_edge(state, c)
+            if edge == self.NONE:
+                matched = 0
+            else:
+                state, matched = self.edge_target[edge], matched + 1
+            starts[j] = j + 1 - matched
+
+        ms = array(self.NODE_TYPE, bytes(4 * m))
+        j = 0
+        for i in range(m):
+            # Last end whose match starts at or before i
+            while j + 1 < m and starts[j + 1] <= i:
+                j += 1
+            ms[i] = max(j - i + 1, 0) if starts[j] <= i else 0
+        return ms
+
+    def search_automaton(self, q):
+        # Length of the longest prefix of q that occurs in the text
+        return self.walk(q)[1]
+
+    def count_occurrences(self):
+        # |endpos| of every state: 1 for each non-clone state, summed up the
+        # suffix links from the longest states down
+        states = len(self.length)
+        by_length = sorted(range(1, states), key=self.length.__getitem__, reverse=True)
+        occurrences = array(self.NODE_TYPE, (0 if cloned else 1 for cloned in self.cloned))
+        for state in by_length:
+            occurrences[self.link[state]] += occurrences[state]
+        return occurrences
+
+    def suffix_link_tree(self):
+        # Inverse suffix links as first-child/next-sibling lists
+        states = len(self.length)
+        first_child = array(self.NODE_TYPE, [self.NONE]) * states
+        next_sibling = array(self.NODE_TYPE, [self.NONE]) * states
+        for state in range(1, states):
+            parent = self.link[state]
+            next_sibling[state] = first_child[parent]
+            first_child[parent] = state
+        return first_child, next_sibling
+
+    def end_offsets(self, state):
+        # endpos of a state: the first end of every non-clone state whose
+        # suffix links lead to it, each text prefix having one such state
+        if self.link_children is None:
+            self.link_children = self.suffix_link_tree()
+        first_child, next_sibling = self.link_children
+        stack = [state]
+        while stack:
+            state = stack.pop()
+            if not self.cloned[state]:
+                yield self.first_end[state]
+            child = first_child[state]
+            while child != self.NONE:
+                stack.append(child)
+                child = next_sibling[child]
+
+    def locate(self, q, limit=None, sort=False):
+        # Reference offsets of q, from the end offsets of its state
+        state, matched = self.walk(q)
+        if matched < len(q):
+            return iter(())
+        if not q:
+            return utils.take_positions(range(self.length[self.last]), limit, sort)
+        m = len(q)
+        return utils.take_positions((end - m + 1 for end in self.end_offsets(state)), limit, sort)
+
+    def count(self, q):
+        state, matched = self.walk(q)
+        if matched < len(q):
+            return 0
+        if self.occurrences is None:
+            self.occurrences = self.count_occurrences()
+        return self.occurrences[state] if state != self.ROOT else self.length[self.last]
+
+def main():
+    args = get_args()
+
+    T, records = None, None
+
+    if args.string:
+        T = args.string
+    elif args.reference:
+        T, records = record_table.join_records(utils.iter_fasta(args.reference))
+
+    print('Extracted file')
+
+    automaton = SuffixAutomaton(T, records=records)
+
+    print('Automaton built')
+
+    if args.query:
+        for query in args.query:
+            match_len = automaton.align(query)
+            print(f'{query} : {match_len}')
+            if args.locate:
+                for record, offset in record_table.locate_records(automaton, query, args.locate, sort=True):
+                    print(f'\t{record}:{offset}')
+
+if __name__ == '__main__':
+    main()
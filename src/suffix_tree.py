@@ -1,5 +1,11 @@
 import argparse
+import itertools
+from array import array
+import index_io
+import profiling
+import record_table
 import utils
+from packed_dna import PackedDNA
 
 def get_args():
     parser = argparse.ArgumentParser(description='Suffix Tree')
@@ -17,114 +23,411 @@ def get_args():
                         nargs='+',
                         type=str)
 
+    parser.add_argument('--packed',
+                        help='Hold the reference as 2-bit packed DNA',
+                        action='store_true')
+
+    parser.add_argument('--index',
+                        help='Load a saved index instead of building one',
+                        type=str)
+
+    parser.add_argument('--build_index', '--build-index',
+                        help='Save the built index to this file',
+                        type=str)
+
+    parser.add_argument('--locate',
+                        help='Print up to this many hits of each query as record:offset',
+                        type=int)
+
+    parser.add_argument('--profile',
+                        help='Count search work and time build phases',
+                        action='store_true')
+
     return parser.parse_args()
 
 
-class SuffixTree():
+class SuffixTree(profiling.Profiled):
     __algorithm_name__ = 'Suffix tree'
-    SUB = 0
-    CHILDREN = 1
+    ROOT = 0
+    NONE = -1
+    OPEN = -1 # End of a leaf edge: grows with the text
+    NODE_TYPE = 'i' # 32-bit node fields, so up to 2**31 - 1 nodes
+    COLUMNS = ('start', 'end', 'link', 'suffix', 'first_child', 'next_sibling')
+    STATE = ('size', 'active_node', 'active_edge', 'active_length', 'remaining')
+    PROFILED_METHODS = {'search_tree': 'profiled_search_tree'}
 
-    def __init__(self, s: str = None):
-        self.s, self.tree = None, None
+    def __init__(self, s: str = None, profile=False, records=None):
+        self.s, self.leaf_counts = None, None
+        self.records = records # RecordTable when s joins several records
+        if profile:
+            self.enable_profiling()
         if s is not None:
             self.setup(s)
 
     def setup(self, s):
-        self.s = s
-        self.tree = self.build_suffix_tree(self.s)
+        self.build_suffix_tree(s)
     
     def align(self, query):
         return self.search_tree(query)
 
-    def add_suffix(self, nodes, suf):
-        n = 0
+    def count(self, q):
+        node = self.find_locus(q)
+        if node == self.NONE:
+            return 0
+        if self.leaf_counts is None:
+            self.leaf_counts = self.count_leaves()
+        return self.leaf_counts[node] + sum(1 for _ in self.pending_matches(q))
+
+    def locate(self, q, limit=None, sort=False):
+        # Reference offsets of q: the leaves below its locus, then any
+        # matching suffixes that the implicit tree has no leaf for yet
+        node = self.find_locus(q)
+        if node == self.NONE:
+            return iter(())
+        return utils.take_positions(itertools.chain(self.leaf_suffixes(node), self.pending_matches(q)),
+                                    limit, sort)
+
+    def find_locus(self, q):
+        # Node at or below the end of q's path, or NONE if q does not occur
+        T, start = self.s, self.start
+
+        n = self.ROOT
         i = 0
-        while i < len(suf):
-            b = suf[i] 
-            children = nodes[n][self.CHILDREN]
-            if b not in children:
-                n2 = len(nodes)
-                nodes.append([suf[i:], {}])
-                nodes[n][self.CHILDREN][b] = n2
-                return
-            else:
-                n2 = children[b]
 
-            sub2 = nodes[n2][self.SUB]
+        while i < len(q):
+            n = self.get_child(n, q[i])
+            if n == self.NONE:
+                return n
+
             j = 0
-            while j < len(sub2) and i + j < len(suf) and suf[i + j] == sub2[j]:
+            offset, edge_length = start[n], self.edge_length(n)
+
+            while i < len(q) and j < edge_length and q[i] == T[offset + j]:
+                i += 1
                 j += 1
 
-            if j < len(sub2):
-                n3 = n2 
-                n2 = len(nodes)
-                nodes.append([sub2[:j], {sub2[j]: n3}])
-                nodes[n3][self.SUB] = sub2[j:]
-                nodes[n][self.CHILDREN][b] = n2
+            if i < len(q) and j < edge_length:
+                return self.NONE
+
+        return n
+
+    def preorder(self, node):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(self.children(node))
 
-            i += j
-            n = n2
+    def leaf_suffixes(self, node):
+        for node in self.preorder(node):
+            if self.end[node] == self.OPEN:
+                yield self.suffix[node]
+
+    def pending_matches(self, q):
+        # Suffixes still implicit after the last phase have no leaf
+        for j in range(self.size - self.remaining, self.size):
+            if self.s[j:j + len(q)] == q:
+                yield j
+
+    def count_leaves(self):
+        counts = array(self.NODE_TYPE, bytes(4 * len(self.start)))
+        for node in reversed(list(self.preorder(self.ROOT))):
+            if self.end[node] == self.OPEN:
+                counts[node] = 1
+            else:
+                counts[node] = sum(counts[child] for child in self.children(node))
+        return counts
+
+    def new_node(self, start, end, suffix=-1):
+        self.start.append(start)
+        self.end.append(end)
+        self.link.append(self.ROOT)
+        self.suffix.append(suffix)
+        self.first_child.append(self.NONE)
+        self.next_sibling.append(self.NONE)
+        return len(self.start) - 1
+
+    def edge_length(self, node):
+        end = self.end[node]
+        return (self.size if end == self.OPEN else end) - self.start[node]
+
+    def get_child(self, node, c):
+        T, start, next_sibling = self.s, self.start, self.next_sibling
+        child = self.first_child[node]
+        while child != self.NONE and T[start[child]] != c:
+            child = next_sibling[child]
+        return child
+
+    def add_child(self, node, child):
+        self.next_sibling[child] = self.first_child[node]
+        self.first_child[node] = child
+
+    def replace_child(self, node, old, new):
+        self.next_sibling[new] = self.next_sibling[old]
+        if self.first_child[node] == old:
+            self.first_child[node] = new
+            return
+        child = self.first_child[node]
+        while self.next_sibling[child] != old:
+            child = self.next_sibling[child]
+        self.next_sibling[child] = new
+
+    def children(self, node):
+        child = self.first_child[node]
+        while child != self.NONE:
+            yield child
+            child = self.next_sibling[child]
 
     def build_suffix_tree(self, text):
-        text += "$"
+        # Nodes are rows of parallel integer arrays. start[n]:end[n] is the
+        # label of the edge into node n as offsets into self.s, children form
+        # a first-child/next-sibling list keyed by the first label character,
+        # and leaves remember their suffix index.
+        self.s, self.size = '', 0
+        for column in self.COLUMNS:
+            setattr(self, column, array(self.NODE_TYPE))
+        self.new_node(0, 0)
 
-        nodes = [ ['', {}] ]
+        # Ukkonen active point and number of suffixes still implicit
+        self.active_node, self.active_edge, self.active_length = self.ROOT, 0, 0
+        self.remaining = 0
 
-        for i in range(len(text)):
-            self.add_suffix(nodes, text[i:])
-        
-        return nodes
+        self.extend(text)
+
+    def extend(self, chars):
+        # Ukkonen phases for each new character; the tree stays implicit (no
+        # terminator), which is all that substring search needs
+        if not isinstance(self.start, array):
+            # Loaded columns are read-only maps; copy them to grow the tree
+            for column in self.COLUMNS:
+                setattr(self, column, array(self.NODE_TYPE, getattr(self, column)))
+        self.s += chars
+        self.leaf_counts = None
+        with profiling.phase(self.profile, 'ukkonen'):
+            for i in range(self.size, len(self.s)):
+                self.size = i + 1
+                self.add_phase(i)
+
+    def add_phase(self, i):
+        T, start = self.s, self.start
+        c = T[i]
+        self.remaining += 1
+        last_internal = None
+
+        while self.remaining > 0:
+            if self.active_length == 0:
+                self.active_edge = i
+            node = self.active_node
+            child = self.get_child(node, T[self.active_edge])
+
+            if child == self.NONE:
+                self.add_child(node, self.new_node(i, self.OPEN, i - self.remaining + 1))
+                if last_internal is not None:
+                    self.link[last_internal] = node
+                    last_internal = None
+            else:
+                edge_length = self.edge_length(child)
+                if self.active_length >= edge_length:
+                    # Walk down to keep the active point inside one edge
+                    self.active_edge += edge_length
+                    self.active_length -= edge_length
+                    self.active_node = child
+                    continue
+
+                if T[start[child] + self.active_length] == c:
+                    # Already present: the rest of the phase is implicit
+                    if last_internal is not None and node != self.ROOT:
+                        self.link[last_internal] = node
+                    self.active_length += 1
+                    break
+
+                split = self.new_node(start[child], start[child] + self.active_length)
+                self.replace_child(node, child, split)
+                start[child] += self.active_length
+                self.add_child(split, child)
+                self.add_child(split, self.new_node(i, self.OPEN, i - self.remaining + 1))
+                if last_internal is not None:
+                    self.link[last_internal] = split
+                last_internal = split
+
+            self.remaining -= 1
+            if self.active_node == self.ROOT and self.active_length > 0:
+                self.active_length -= 1
+                self.active_edge = i - self.remaining + 1
+            elif self.active_node != self.ROOT:
+                self.active_node = self.link[self.active_node]
+
+    def save(self, path):
+        sections = index_io.text_sections(self.s)
+        sections.update((column, getattr(self, column)) for column in self.COLUMNS)
+        scalars = {field: getattr(self, field) for field in self.STATE}
+        if self.records is not None:
+            scalars.update(self.records.scalars())
+        index_io.write_index(path, type(self).__name__, index_io.reference_checksum(self.s),
+                             sections, scalars)
+
+    @classmethod
+    def load(cls, path):
+        # Node columns stay memory-mapped, read through memoryviews so that
+        # search_tree indexes them as plain ints
+        header, sections = index_io.read_index(path, cls.__name__)
+        tree = cls()
+        text = index_io.read_text(sections)
+        tree.s = text if isinstance(text, PackedDNA) else text.tobytes().decode('latin-1')
+        for column in cls.COLUMNS:
+            setattr(tree, column, memoryview(sections[column]))
+        for field in cls.STATE:
+            setattr(tree, field, header['scalars'][field])
+        tree.records = record_table.RecordTable.from_scalars(header['scalars'])
+        return tree
 
     def search_tree(self, P):
-        P += "$"
+        # Length of the longest prefix of P that occurs in the text
+        T, start = self.s, self.start
         
-        n = 0
+        n = self.ROOT
         i = 0
 
         while i < len(P):
-            j = 0
+            n = self.get_child(n, P[i])
+            if n == self.NONE:
+                return i
 
-            sub = self.tree[n][self.SUB]
+            j = 0
+            offset, edge_length = start[n], self.edge_length(n)
 
-            while (i + j) < len(P) and j < len(sub) and P[i + j] == sub[j]:
+            while i < len(P) and j < edge_length and P[i] == T[offset + j]:
+                i += 1
                 j += 1
-            
-            i += j
-            if j == len(sub):
-                if i == len(P):
-                    # print(f'Complete match on {P}')
-                    return i - 1
+
+            if j < edge_length:
+                return i
+
+        return i
+
+    def matching_statistics(self, read):
+        # ms[i] = length of the longest prefix of read[i:] that occurs in the
+        # text, for every i in one pass. The match is kept as the deepest
+        # node on its path (node, at string depth depth) plus a partial edge
+        # into child. Dropping its first character follows the node's suffix
+        # link and re-descends only the rest of the match, a whole edge at a
+        # time (skip/count), so the pass is linear in len(read) overall.
+        T, start, end, link = self.s, self.start, self.end, self.link
+        m = len(read)
+        ms = array(self.NODE_TYPE, bytes(4 * m))
+        node, depth, matched = self.ROOT, 0, 0
+
+        for i in range(m):
+            # Skip/count down to the deepest node within the match; leaves
+            # are never entered, as they have no suffix link
+            child = self.NONE
+            while matched > depth:
+                child = self.get_child(node, read[i + depth])
+                edge_length = self.edge_length(child)
+                if depth + edge_length > matched or end[child] == self.OPEN:
+                    break
+                node, depth, child = child, depth + edge_length, self.NONE
+
+            # Extend the match one character at a time
+            while i + matched < m:
+                if child == self.NONE:
+                    child = self.get_child(node, read[i + matched])
+                    if child == self.NONE:
+                        break
+                    matched += 1
+                elif matched - depth < self.edge_length(child):
+                    if T[start[child] + matched - depth] != read[i + matched]:
+                        break
+                    matched += 1
+                elif end[child] != self.OPEN:
+                    node, depth, child = child, matched, self.NONE
                 else:
-                    # print(f'Match {P[:i]} with {sub}')
-                    if P[i] in self.tree[n][self.CHILDREN]:
-                        n = self.tree[n][self.CHILDREN][P[i]]
-                    else:
-                        return i
-            else:
+                    break # End of the text
+            ms[i] = matched
+
+            if matched == 0:
+                continue
+            matched -= 1
+            if node != self.ROOT:
+                node, depth = link[node], depth - 1
+
+        return ms
+
+    def profiled_search_tree(self, P):
+        # search_tree with counters: every child examined on the way down is
+        # a node visited and one comparison of its first character
+        T, start, first_child, next_sibling = self.s, self.start, self.first_child, self.next_sibling
+        profile = self.profile
+
+        n = self.ROOT
+        i = 0
+
+        while i < len(P):
+            c = P[i]
+            child = first_child[n]
+            while child != self.NONE:
+                profile.nodes_visited += 1
+                profile.char_comparisons += 1
+                if T[start[child]] == c:
+                    break
+                child = next_sibling[child]
+            n = child
+            if n == self.NONE:
                 return i
 
+            j = 0
+            offset, edge_length = start[n], self.edge_length(n)
+
+            while i < len(P) and j < edge_length:
+                profile.char_comparisons += 1
+                if P[i] != T[offset + j]:
+                    break
+                i += 1
+                j += 1
+
+            if j < edge_length:
+                return i
+
+        return i
+
 def main():
     args = get_args()
 
-    T = None
+    T, records = None, None
 
     if args.string:
         T = args.string
     elif args.reference:
-        reference = utils.read_fasta(args.reference)
-        T = reference[0][1]
+        T, records = record_table.join_records(utils.iter_fasta(args.reference))
 
     print('Extracted file')
 
-    tree = SuffixTree(T)
+    if args.index:
+        tree = SuffixTree.load(args.index)
+        if args.profile:
+            tree.enable_profiling()
+        if T is not None:
+            index_io.check_reference(args.index, T)
+    else:
+        if args.packed:
+            T = PackedDNA(T)
+        tree = SuffixTree(T, profile=args.profile, records=records)
+        if args.build_index:
+            tree.save(args.build_index)
 
     print('Tree built')
     
     if args.query:
         for query in args.query:
+            if args.profile:
+                tree.profile.reset()
             match_len = tree.align(query)
             print(f'{query} : {match_len}')
+            if args.locate:
+                for record, offset in record_table.locate_records(tree, query, args.locate, sort=True):
+                    print(f'\t{record}:{offset}')
+            if args.profile:
+                print(profiling.format_stats(tree.stats()))
 
 if __name__ == '__main__':
     main()
@@ -1,5 +1,10 @@
 import argparse
+from array import array
+import index_io
+import profiling
+import record_table
 import utils
+from packed_dna import PackedDNA
 
 def get_args():
     parser = argparse.ArgumentParser(description='Suffix Trie')
@@ -17,70 +22,189 @@ def get_args():
                         nargs='+',
                         type=str)
 
+    parser.add_argument('--packed',
+                        help='Hold the reference as 2-bit packed DNA',
+                        action='store_true')
+
+    parser.add_argument('--index',
+                        help='Load a saved index instead of building one',
+                        type=str)
+
+    parser.add_argument('--build_index', '--build-index',
+                        help='Save the built index to this file',
+                        type=str)
+
+    parser.add_argument('--profile',
+                        help='Count search work and time build phases',
+                        action='store_true')
+
     return parser.parse_args()
 
-class SuffixTrie():
+class SuffixTrie(profiling.Profiled):
     __algorithm_name__ = 'Suffix trie'
-    SUB = 0
-    CHILDREN = 1
-
-    def __init__(self, s: str = None):
-        self.s, self.trie = None, None
+    ROOT = 0
+    NONE = -1
+    NODE_TYPE = 'i' # 32-bit child links, so up to 2**31 - 1 nodes
+    PROFILED_METHODS = {'search_trie': 'profiled_search_trie'}
+
+    def __init__(self, s: str = None, profile=False):
+        self.s, self.trie, self.leaf_counts = None, None, None
+        self.records = None # The trie only ever holds a prefix of one text
+        if profile:
+            self.enable_profiling()
         if s is not None:
             self.setup(s)
 
     def setup(self, s):
         self.s = s
-        self.trie = self.build_suffix_trie(self.s)
+        with profiling.phase(self.profile, 'trie'):
+            self.trie = self.build_suffix_trie(self.s)
     
     def align(self, query):
         return self.search_trie(self.trie, query)
 
+    def count(self, q):
+        if not q:
+            return len(self.s) # Every position but the '$' sentinel
+        node = self.find_node(q)
+        if node == self.NONE:
+            return 0
+        if self.leaf_counts is None:
+            self.leaf_counts = self.count_leaves()
+        return self.leaf_counts[node]
+
+    def locate(self, q, limit=None, sort=False):
+        # Every suffix ends in a '$' leaf, whose depth gives its offset
+        node = self.find_node(q)
+        if node == self.NONE:
+            return iter(())
+        labels = self.trie[0]
+        positions = (len(self.s) + 1 - depth
+                     for node, depth in self.preorder(node, len(q))
+                     if labels[node] == ord('$') and depth > 1) # Not the '$' suffix itself
+        return utils.take_positions(positions, limit, sort)
+
+    def find_node(self, q):
+        labels, first_child, next_sibling = self.trie
+        node_index = self.ROOT
+        for curr_char in q:
+            curr_char = ord(curr_char)
+            node_index = first_child[node_index]
+            while node_index != self.NONE and labels[node_index] != curr_char:
+                node_index = next_sibling[node_index]
+            if node_index == self.NONE:
+                break
+        return node_index
+
+    def preorder(self, node_index, depth=0):
+        # (node, depth) pairs of the subtree under node_index
+        _, first_child, next_sibling = self.trie
+        stack = [(node_index, depth)]
+        while stack:
+            node_index, depth = stack.pop()
+            yield node_index, depth
+            child_index = first_child[node_index]
+            while child_index != self.NONE:
+                stack.append((child_index, depth + 1))
+                child_index = next_sibling[child_index]
+
+    def count_leaves(self):
+        labels, first_child, next_sibling = self.trie
+        counts = array(self.NODE_TYPE, bytes(4 * len(labels)))
+        for node_index, _ in reversed(list(self.preorder(self.ROOT))):
+            if labels[node_index] == ord('$') and node_index != self.ROOT:
+                counts[node_index] = 1
+            child_index = first_child[node_index]
+            while child_index != self.NONE:
+                counts[node_index] += counts[child_index]
+                child_index = next_sibling[child_index]
+        return counts
+
     def build_suffix_trie(self, s):
+        # Nodes are rows of parallel arrays: the byte labelling the edge into
+        # each node, and first-child/next-sibling links between nodes
         s += "$"
+        s = s.codes().tobytes() if isinstance(s, PackedDNA) else s.encode('latin-1')
 
-        nodes = [ ['', {}] ]
+        labels = bytearray(1)
+        first_child = array(self.NODE_TYPE, [self.NONE])
+        next_sibling = array(self.NODE_TYPE, [self.NONE])
 
         for suf_offset in reversed(range(len(s))):
             # suf = s[i:]
-            node_index, char_index = 0, 0
-            while char_index < len(s)-suf_offset:
-                curr_char = s[char_index+suf_offset]
-                if curr_char not in nodes[node_index][self.CHILDREN]:
-                    new_node_index = len(nodes)
-                    nodes.append([curr_char, {}])
-                    nodes[node_index][self.CHILDREN][curr_char] = new_node_index
-                    node_index = new_node_index
-                else:
-                    node_index = nodes[node_index][self.CHILDREN][curr_char]
-                char_index += 1
+            node_index = self.ROOT
+            for curr_char in s[suf_offset:]:
+                child_index = first_child[node_index]
+                while child_index != self.NONE and labels[child_index] != curr_char:
+                    child_index = next_sibling[child_index]
+
+                if child_index == self.NONE:
+                    child_index = len(labels)
+                    labels.append(curr_char)
+                    first_child.append(self.NONE)
+                    next_sibling.append(first_child[node_index])
+                    first_child[node_index] = child_index
+                node_index = child_index
         
-        return nodes
+        return labels, first_child, next_sibling
+
+    def save(self, path):
+        labels, first_child, next_sibling = self.trie
+        index_io.write_index(path, type(self).__name__, index_io.reference_checksum(self.s),
+                             {**index_io.text_sections(self.s),
+                              'labels': labels,
+                              'first_child': first_child,
+                              'next_sibling': next_sibling})
+
+    @classmethod
+    def load(cls, path):
+        _, sections = index_io.read_index(path, cls.__name__)
+        trie = cls()
+        text = index_io.read_text(sections)
+        trie.s = text if isinstance(text, PackedDNA) else text.tobytes().decode('latin-1')
+        trie.trie = tuple(memoryview(sections[column])
+                          for column in ('labels', 'first_child', 'next_sibling'))
+        return trie
 
     def search_trie(self, trie, pattern):
-        P = pattern
-        P += "$"
+        # Length of the longest prefix of pattern that occurs in the text
+        labels, first_child, next_sibling = trie
         
-        node_index, pattern_index = 0, 0
-        while pattern_index < len(P):
-            substring_index = 0
-
-            node_substring = trie[node_index][self.SUB]
-
-            if (pattern_index + substring_index) < len(P) and substring_index < len(node_substring) and P[pattern_index + substring_index] == node_substring[substring_index]:
-                substring_index += 1
-            
-            pattern_index += substring_index
-            if substring_index == len(node_substring):
-                if pattern_index == len(P): # Complete match
-                    return pattern_index - 1
-                else: # Pattern isn't fully matched yet
-                    if P[pattern_index] in trie[node_index][self.CHILDREN]:
-                        node_index = trie[node_index][self.CHILDREN][P[pattern_index]]
-                    else:
-                        return pattern_index
-            else:
+        node_index, pattern_index = self.ROOT, 0
+        while pattern_index < len(pattern):
+            curr_char = ord(pattern[pattern_index])
+            node_index = first_child[node_index]
+            while node_index != self.NONE and labels[node_index] != curr_char:
+                node_index = next_sibling[node_index]
+
+            if node_index == self.NONE:
+                return pattern_index
+            pattern_index += 1
+
+        return pattern_index
+
+    def profiled_search_trie(self, trie, pattern):
+        # search_trie with counters: every sibling examined is a node visited
+        # and one comparison of its label
+        labels, first_child, next_sibling = trie
+        profile = self.profile
+
+        node_index, pattern_index = self.ROOT, 0
+        while pattern_index < len(pattern):
+            curr_char = ord(pattern[pattern_index])
+            node_index = first_child[node_index]
+            while node_index != self.NONE:
+                profile.nodes_visited += 1
+                profile.char_comparisons += 1
+                if labels[node_index] == curr_char:
+                    break
+                node_index = next_sibling[node_index]
+
+            if node_index == self.NONE:
                 return pattern_index
+            pattern_index += 1
+
+        return pattern_index
 
 def main():
     args = get_args()
@@ -90,21 +214,33 @@ def main():
     if args.string:
         T = args.string
     elif args.reference:
-        reference = utils.read_fasta(args.reference)
-        T = reference[0][1]
+        T, _ = record_table.join_records(utils.iter_fasta(args.reference))
 
     print('Extracted file')
 
-    T = T[:5000]
-
-    trie = SuffixTrie(T)
+    if args.index:
+        trie = SuffixTrie.load(args.index)
+        if args.profile:
+            trie.enable_profiling()
+        if T is not None:
+            index_io.check_reference(args.index, T[:5000])
+    else:
+        # Truncate before packing: slicing a PackedDNA gives back a str
+        T = PackedDNA(T[:5000]) if args.packed else T[:5000]
+        trie = SuffixTrie(T, profile=args.profile)
+        if args.build_index:
+            trie.save(args.build_index)
 
     print('Trie built')
 
     if args.query:
         for query in args.query:
+            if args.profile:
+                trie.profile.reset()
             match_len = trie.align(query)
             print(f'{query} : {match_len}')
+            if args.profile:
+                print(profiling.format_stats(trie.stats()))
 
 if __name__ == '__main__':
     main()
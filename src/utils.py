@@ -1,41 +1,184 @@
-import random
+import itertools
 import numpy as np
 import gzip
+import record_table
 
 
+FASTA_CHUNK_SIZE = 1 << 20
+FASTA_UPPER = bytes.maketrans(b'abcdefghijklmnopqrstuvwxyz', b'ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+FASTA_WHITESPACE = b' \t\r\n'
+
+def iter_fasta(file, out=None, max_bases=None, chunk_size=FASTA_CHUNK_SIZE):
+    # Yields (name, sequence) one record at a time, reading the file in
+    # chunks. Sequences are upper-cased str, or views into out when it is
+    # given: memoryviews for a bytearray, array views for a NumPy uint8
+    # array, so nothing is copied. Stops after max_bases bases in total, or
+    # when out is full.
+    if out is not None:
+        view = np.frombuffer(out, dtype=np.uint8) if isinstance(out, bytearray) else out
+        buffer = memoryview(out) if isinstance(out, bytearray) else out # Slicing a bytearray copies
+        max_bases = len(view) if max_bases is None else min(max_bases, len(view))
+    bases = 0
+
+    def record(name, sequence, start):
+        if out is None:
+            return name, sequence.decode('latin-1')
+        return name, buffer[start:bases]
+
+    opener = gzip.open if file.endswith('.gz') else open
+    with opener(file, 'rb') as f:
+        name, sequence, start = None, bytearray(), 0
+        at_line_start, buffered = True, b''
+
+        while max_bases is None or bases < max_bases:
+            chunk = f.read(chunk_size)
+            data = buffered + chunk
+            buffered = b''
+            if not data:
+                break
+
+            pos = 0
+            while pos < len(data):
+                if at_line_start and data[pos] == ord('>'):
+                    end = data.find(b'\n', pos)
+                    if end < 0 and chunk:
+                        buffered = data[pos:] # Header continues in the next chunk
+                        break
+                    end = len(data) if end < 0 else end
+                    if name is not None:
+                        yield record(name, sequence, start)
+                    name = data[pos + 1:end].decode('latin-1').rstrip()
+                    sequence, start = bytearray(), bases
+                    pos = end + 1
+                    continue
+
+                end = data.find(b'\n>', pos)
+                stop = len(data) if end < 0 else end + 1
+                piece = data[pos:stop].translate(FASTA_UPPER, FASTA_WHITESPACE)
+                if max_bases is not None:
+                    piece = piece[:max_bases - bases]
+                if out is None:
+                    sequence += piece
+                else:
+                    view[bases:bases + len(piece)] = np.frombuffer(piece, dtype=np.uint8)
+                bases += len(piece)
+                at_line_start = data[stop - 1] == ord('\n')
+                pos = stop
+
+                if max_bases is not None and bases >= max_bases:
+                    break
+
+        if name is not None:
+            yield record(name, sequence, start)
+
+def iter_fastq(file):
+    # Yields (name, sequence) of each four-line FASTQ record, upper-cased;
+    # the qualities are skipped
+    opener = gzip.open if file.endswith('.gz') else open
+    with opener(file, 'rb') as f:
+        for header in f:
+            if not header.strip():
+                continue
+            lines = list(itertools.islice(f, 3))
+            if header[:1] != b'@' or len(lines) < 3 or lines[1][:1] != b'+':
+                raise ValueError(f'{file}: malformed FASTQ record {header.strip()[:40]!r}')
+            yield (header[1:].decode('latin-1').rstrip(),
+                   lines[0].translate(FASTA_UPPER, FASTA_WHITESPACE).decode('latin-1'))
+
+def iter_reads(file):
+    # (name, sequence) from a FASTA or FASTQ file, told apart by its first
+    # character
+    opener = gzip.open if file.endswith('.gz') else open
+    with opener(file, 'rb') as f:
+        first = f.read(4096).lstrip()[:1]
+    if first == b'@':
+        return iter_fastq(file)
+    if first in (b'>', b''):
+        return iter_fasta(file)
+    raise ValueError(f'{file} is neither FASTA nor FASTQ')
+
 def read_fasta(file):
-    if file.endswith('.gz'):
-        with gzip.open(file, 'rt') as f:
-            data = f.read().split('>')
-            data = [x for x in data if x != '']
-            data = [x.split('\n') for x in data]
-            data = [[x[0], ''.join(x[1:]).upper()] for x in data]
-        return data
-    else:
-        with open(file, 'r') as f:
-            data = f.read().split('>')
-            data = [x for x in data if x != '']
-            data = [x.split('\n') for x in data]
-            data = [[x[0], ''.join(x[1:]).upper()] for x in data]
-        return data
-
-def get_kmers(seq, k):
-    return [seq[i:i+k] for i in range(len(seq) - k + 1)]
-
-def sim_reads(seq, read_length, num_reads, error_rate):
-    kmers = get_kmers(seq, read_length)
-    seed_reads = [random.choice(kmers) for i in range(num_reads)]
-
-    reads = [] 
-
-    for read in seed_reads:
-        error_mask = np.random.poisson(error_rate, read_length)
-        flips = np.where(error_mask == 1)[0]
-        read_array = list(read)
-        for flip in flips:
-            new_char = random.choice('ACGT')
-            read_array[flip] = new_char
-        read = ''.join(read_array)
-        reads.append(read)
-
-    return reads
+    return [[name, sequence] for name, sequence in iter_fasta(file)]
+
+POSITION_BLOCK = 4096
+
+def take_positions(positions, limit=None, sort=False):
+    # Shared tail of the index locate() generators. positions is an iterator
+    # of ints or of NumPy blocks of them; blocks are unpacked a few thousand
+    # at a time so that no long list is ever built. Sorting needs every
+    # position, which is gathered in one compact int64 array.
+    def unpacked(positions):
+        for block in positions:
+            if isinstance(block, np.ndarray):
+                for start in range(0, len(block), POSITION_BLOCK):
+                    yield from block[start:start + POSITION_BLOCK].tolist()
+            else:
+                yield block
+
+    positions = unpacked(positions)
+    if sort:
+        positions = unpacked([np.sort(np.fromiter(positions, dtype=np.int64))])
+    return itertools.islice(positions, limit)
+
+READ_BATCH = 1 << 14 # Reads simulated per batch
+MAX_REDRAWS = 100
+BASE_BYTES = np.frombuffer(b'ACGT', dtype=np.uint8)
+BASE_INDEX = np.zeros(256, dtype=np.uint8) # N and others count as A
+BASE_INDEX[BASE_BYTES] = np.arange(4)
+
+def sim_reads(seq, read_length, num_reads, error_rate, seed=0, batch_size=READ_BATCH):
+    # Yields lists of up to batch_size reads, num_reads in all, drawn from
+    # seq (str, bytes or a uint8 array) with a fixed seed. Start offsets and
+    # error masks are drawn a batch at a time, the reads are sliced out of
+    # one uint8 view of seq and each erroneous base becomes one of the three
+    # others. Windows that span a record separator are drawn again.
+    if isinstance(seq, str):
+        seq = seq.encode('latin-1')
+    view = np.frombuffer(seq, dtype=np.uint8) if isinstance(seq, (bytes, bytearray)) else seq
+    if read_length > len(view):
+        raise ValueError(f'Reads of length {read_length} do not fit a reference of {len(view)} bases')
+    windows = np.lib.stride_tricks.sliding_window_view(view, read_length)
+    separator = ord(record_table.SEPARATOR)
+    rng = np.random.default_rng(seed)
+
+    for done in range(0, num_reads, batch_size):
+        count = min(batch_size, num_reads - done)
+        starts = rng.integers(0, len(windows), count)
+        reads = windows[starts]
+        for _ in range(MAX_REDRAWS):
+            spanning = np.flatnonzero((reads == separator).any(axis=1))
+            if len(spanning) == 0:
+                break
+            starts[spanning] = rng.integers(0, len(windows), len(spanning))
+            reads[spanning] = windows[starts[spanning]]
+        else:
+            raise ValueError('Too few read windows without a record separator')
+
+        # Each base is substituted with probability error_rate, always by a
+        # different base. Earlier versions flipped where a Poisson(error_rate)
+        # draw was exactly 1, to a random base that could be the same one,
+        # so substituted at about 0.75 * error_rate * exp(-error_rate)
+        errors = rng.random(reads.shape) < error_rate
+        shifts = rng.integers(1, 4, int(errors.sum()), dtype=np.uint8)
+        reads[errors] = BASE_BYTES[(BASE_INDEX[reads[errors]] + shifts) % 4]
+
+        data = reads.tobytes().decode('latin-1')
+        yield [data[i:i + read_length] for i in range(0, len(data), read_length)]
+
+def write_reads(file, batches, fastq=None, quality='I'):
+    # Streams batches of reads to a FASTA file, or FASTQ (with a constant
+    # quality) when fastq is set or the name ends in .fq/.fastq. Returns the
+    # number of reads written.
+    if fastq is None:
+        fastq = file.removesuffix('.gz').endswith(('.fq', '.fastq'))
+    opener = gzip.open if file.endswith('.gz') else open
+    written = 0
+    with opener(file, 'wt') as f:
+        for batch in batches:
+            if fastq:
+                f.writelines(f'@read{written + i}\n{read}\n+\n{quality * len(read)}\n'
+                             for i, read in enumerate(batch))
+            else:
+                f.writelines(f'>read{written + i}\n{read}\n' for i, read in enumerate(batch))
+            written += len(batch)
+    return written
@@ -0,0 +1,20 @@
+import random
+import numpy as np
+import pytest
+import external_build
+from suffix_array import SuffixArray, prefix_doubling, text_codes
+
+def random_text(n, alphabet='ACGT', seed=0):
+    rng = random.Random(seed)
+    return ''.join(rng.choice(alphabet) for _ in range(n))
+
+@pytest.mark.parametrize('text', [random_text(40000), 'ACGT' * 10000 + random_text(3000, 'AC')])
+@pytest.mark.parametrize('max_files', [external_build.MAX_FILES, 3])
+def test_external_build_matches_prefix_doubling(text, max_files, tmp_path, monkeypatch):
+    # The smallest budget gives runs of MIN_ITEMS records, so about ten runs
+    # to merge and as many partitions per round; three files at a time
+    # forces several merge passes and nested partitioning
+    monkeypatch.setattr(external_build, 'MAX_FILES', max_files)
+    index = SuffixArray.build_external(text, str(tmp_path / 'index'), memory_budget=1,
+                                       scratch_dir=str(tmp_path))
+    assert np.array_equal(index.array, prefix_doubling(text_codes(text + '$')))
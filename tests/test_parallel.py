@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+import parallel_build
+from packed_dna import PackedDNA
+from parallel_query import ParallelAligner
+from suffix_array import SuffixArray, prefix_doubling, text_codes
+from suffix_tree import SuffixTree
+
+TEXT = 'ACGTACGGTACGTTACNGTAC'
+QUERIES = ['A', 'ACG', 'GTAC', 'TTT', '', 'NGT', 'CGTTACNGTACG', 'G' * 30]
+
+@pytest.mark.parametrize('index_type', [SuffixArray, SuffixTree])
+def test_parallel_aligner_matches_serial(index_type):
+    index = index_type(TEXT)
+    with ParallelAligner(index, processes=2, chunk_size=3) as aligner:
+        assert list(aligner.align(QUERIES)) == [index.align(query) for query in QUERIES]
+
+@pytest.mark.parametrize('index_type', [SuffixArray, SuffixTree])
+def test_parallel_aligner_shares_saved_index(index_type, tmp_path):
+    path = str(tmp_path / 'index')
+    index_type(TEXT).save(path)
+    index = index_type.load(path)
+    with ParallelAligner(path, processes=2, chunk_size=3) as aligner:
+        assert list(aligner.align(QUERIES)) == [index.align(query) for query in QUERIES]
+
+def test_parallel_aligner_rejects_sparse_array():
+    with pytest.raises(ValueError):
+        ParallelAligner(SuffixArray(TEXT, sparse_step=2), processes=1)
+
+@pytest.mark.parametrize('text', [TEXT * 50, 'A' * 300, 'héllo wörld héllo' * 10])
+def test_parallel_build_matches_prefix_doubling(text):
+    codes = text_codes(text + '$')
+    assert np.array_equal(parallel_build.bucket_sort_suffixes(codes, processes=2), prefix_doubling(codes))
+
+@pytest.mark.parametrize('index_type', [SuffixArray, SuffixTree])
+def test_parallel_aligner_reads_packed_saved_index(index_type, tmp_path):
+    path = str(tmp_path / 'index')
+    index_type(PackedDNA(TEXT)).save(path)
+    index = index_type(TEXT)
+    with ParallelAligner(path, processes=2, chunk_size=3) as aligner:
+        assert list(aligner.align(QUERIES)) == [index.align(query) for query in QUERIES]
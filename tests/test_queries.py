@@ -0,0 +1,97 @@
+import pytest
+import index_io
+import record_table
+from enhanced_suffix_array import EnhancedSuffixArray
+from fm_index import FMIndex
+from lazy_suffix_tree import LazySuffixTree
+from packed_dna import PackedDNA
+from suffix_array import SuffixArray
+from suffix_automaton import SuffixAutomaton
+from suffix_tree import SuffixTree
+from suffix_trie import SuffixTrie
+
+TEXT = 'ACGTACGGTAC'
+
+@pytest.mark.parametrize('query', ['0', '0123', 'A0', 'AC1', 'ACG3'])
+def test_kmer_table_rejects_digits(query):
+    # Digits are what QUERY_DIGITS turns bases into, not bases themselves
+    plain, table = SuffixArray(TEXT), SuffixArray(TEXT, kmer_length=3)
+    assert table.count(query) == plain.count(query) == 0
+    assert list(table.locate(query)) == []
+    assert table.search_array(query) is None
+
+def test_kmer_table_matches_plain_array():
+    plain, table = SuffixArray(TEXT), SuffixArray(TEXT, kmer_length=3)
+    for query in ['A', 'AC', 'ACG', 'ACGT', 'GTAC', 'TT', 'N']:
+        assert table.count(query) == plain.count(query)
+
+@pytest.mark.parametrize('query', ['0', '0123', 'A0', 'AC1', 'ACG3'])
+def test_packed_text_rejects_digits(query):
+    packed = SuffixArray(PackedDNA(TEXT))
+    assert packed.count(query) == SuffixArray(TEXT).count(query) == 0
+    assert PackedDNA(TEXT).match_length(0, query) == len(query) - len(query.lstrip('ACGT'))
+
+def test_sparse_packed_matches_plain():
+    text = 'ACGTNACGGTACGTTACNNGTAC' * 3
+    plain = SuffixArray(text)
+    for step in (2, 3, 5):
+        packed = SuffixArray(PackedDNA(text), sparse_step=step)
+        for query in ['A', 'GT', 'ACG', 'NAC', 'TACGTTAC', 'GGG']:
+            assert sorted(packed.locate(query)) == sorted(plain.locate(query))
+
+def all_indexes(text):
+    return [SuffixArray(text), SuffixArray(text, kmer_length=2), SuffixArray(text, sparse_step=3),
+            SuffixArray(PackedDNA(text)), EnhancedSuffixArray(text), FMIndex(text), SuffixTrie(text),
+            SuffixTree(text), LazySuffixTree(text), SuffixAutomaton(text)]
+
+@pytest.mark.parametrize('query', ['', 'A', 'AC', 'GTAC', 'ACGG', 'TTT'])
+def test_counts_agree(query):
+    expected = sum(TEXT.startswith(query, i) for i in range(len(TEXT)))
+    for index in all_indexes(TEXT):
+        assert index.count(query) == expected, type(index).__name__
+
+@pytest.mark.parametrize('query', ['', 'A', 'AC', 'GTAC', 'TTT'])
+def test_locate_records_agree(query):
+    expected = [(None, i) for i in range(len(TEXT)) if TEXT.startswith(query, i)]
+    for index in all_indexes(TEXT):
+        if hasattr(index, 'locate'):
+            assert list(record_table.locate_records(index, query, sort=True)) == expected, type(index).__name__
+
+@pytest.mark.parametrize('query', ['llo', 'é', 'ö', 'héllo w', 'z', 'Ā', 'lo'])
+def test_fm_index_non_ascii_matches_array(query):
+    text = 'héllo wörld héllo'
+    fm, array = FMIndex(text), SuffixArray(text)
+    assert fm.count(query) == array.count(query)
+    assert sorted(fm.locate(query)) == sorted(array.locate(query))
+
+@pytest.mark.parametrize('index_type', [SuffixArray, SuffixTree, SuffixTrie])
+def test_packed_text_stays_packed_when_saved(index_type, tmp_path):
+    text = 'ACGTNNACGGTACGTTACRGTAC' * 4
+    path = str(tmp_path / 'index')
+    index_type(PackedDNA(text)).save(path)
+    loaded = index_type.load(path)
+    assert 'text' not in index_io.read_header(path)['sections']
+    assert isinstance(loaded.T if index_type is SuffixArray else loaded.s, PackedDNA)
+    plain = index_type(text)
+    for query in ['ACG', 'NNAC', 'TACR', 'GGG', 'CGTTACRGTACACG']:
+        assert loaded.align(query) == plain.align(query)
+
+def test_packed_text_size_and_lookups():
+    text = 'ACGTNNNACGGTRACGTTAC$' * 100
+    packed = PackedDNA(text)
+    assert len(packed.packed) == -(-len(text) // 4)
+    assert str(packed) == text
+    assert ''.join(packed[i] for i in range(len(text))) == text
+    assert packed.take(range(len(text))).tobytes().decode() == text
+    assert packed.codes(5, 17).tobytes().decode() == text[5:17]
+
+def test_lazy_tree_prune_keeps_top_levels():
+    text = 'ACGTACGGTACGTTACNGTACAGGATTACA' * 5
+    capped, full = LazySuffixTree(text, max_nodes=40), LazySuffixTree(text)
+    queries = ['ACG', 'TTAC', 'GGAT', 'NGTA', 'CAGGATTACAACG', 'TTT', 'ATTACAACGTACGG'] * 3
+    for query in queries:
+        assert capped.align(query) == full.align(query)
+        assert capped.count(query) == full.count(query)
+        assert sorted(capped.locate(query)) == sorted(full.locate(query))
+        assert len(capped.start) <= 40 + len(text) # One search adds at most a path
+        assert capped.expanded[capped.ROOT]
@@ -0,0 +1,25 @@
+import pytest
+import utils
+
+READS = ['ACGTACGT', 'GGTTAACC', 'ACGTNNAC']
+
+@pytest.mark.parametrize('name', ['reads.fa', 'reads.fq', 'reads.fq.gz'])
+def test_iter_reads_reads_written_reads(name, tmp_path):
+    path = str(tmp_path / name)
+    assert utils.write_reads(path, [READS[:2], READS[2:]]) == len(READS)
+    assert [sequence for _, sequence in utils.iter_reads(path)] == READS
+
+def test_iter_reads_rejects_other_files(tmp_path):
+    path = tmp_path / 'reads.txt'
+    path.write_text('ACGT\nACGT\n')
+    with pytest.raises(ValueError):
+        utils.iter_reads(str(path))
+
+def test_iter_fasta_yields_views_into_out(tmp_path):
+    path = tmp_path / 'ref.fa'
+    path.write_text('>a\nACGT\nac\n>b\nGGT\n')
+    out = bytearray(16)
+    records = list(utils.iter_fasta(str(path), out=out))
+    assert [(name, bytes(sequence)) for name, sequence in records] == [('a', b'ACGTAC'), ('b', b'GGT')]
+    out[0:1] = b'T'
+    assert bytes(records[0][1]) == b'TCGTAC'